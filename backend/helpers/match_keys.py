@@ -0,0 +1,27 @@
+# helpers/match_keys.py
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+
+def build_match_key(home_team_id: str, away_team_id: str, dt: datetime) -> str:
+    """
+    Normaliserar till ett dags-nyckel i UTC: YYYY-MM-DD|home|away
+    Använder bara datum (inte klockslag) så att samma match samma dag
+    inte kan skapas dubbelt av samma användare.
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    day = dt.astimezone(timezone.utc).strftime("%Y-%m-%d")
+    return f"{day}|{home_team_id}|{away_team_id}"
+
+
+def match_date(value: Any) -> Optional[datetime]:
+    """Matchdatum som datetime; äldre dokument kan ha ISO-strängar. None om datumet inte går att tolka."""
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        return value
+    return None
@@ -1,5 +1,7 @@
 # helpers/schedule_elit.py
 # (B/V/R/G + siffra 1..7 per gate)
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence, Tuple
+
 ELITSERIEN_2_15_7 = [
     # heat,  gate1, gate2, gate3, gate4
     ( 1,  "B2",  "V1",  "R1",  "G2"),
@@ -35,4 +37,81 @@ COLOR_TO_HELMET = {
     "B": "#2563EB",
     "G": "#FACC15",
     "V": "#FFFFFF",
-}
\ No newline at end of file
+}
+
+
+# ---------------------------------------------------------------------------
+# Förkompilerade scheman
+# ---------------------------------------------------------------------------
+# Strängcellerna ("R5", "V/R") tolkas en gång vid import. Heat-generering
+# indexerar sedan direkt: (heat, gate) -> GateSlot -> lineup-slot -> förare.
+
+class GateSlot(NamedTuple):
+    team: Optional[str]            # "home" | "away" | None (nominering)
+    lineup_no: Optional[int]       # 1..7, None för nominering
+    helmet_color: Optional[str]
+    nomination: bool
+    color_choices: Tuple[str, ...]  # t.ex. ("V", "R") för nomineringsheat
+
+
+class CompiledSchedule(NamedTuple):
+    name: str
+    heats: Tuple[Tuple[int, Tuple[GateSlot, ...]], ...]  # (heat_no, (gate1..gate4))
+    max_lineup_no: int
+
+    @property
+    def nomination_heats(self) -> Tuple[int, ...]:
+        return tuple(no for no, slots in self.heats if any(s.nomination for s in slots))
+
+    def nomination_pattern(self, heat_no: int) -> Dict[str, Tuple[str, str]]:
+        """
+        gate -> (team, färgbokstav) för ett nomineringsheat. Gates som delar
+        samma cell ("V/R") får färgerna i gate-ordning: första V, andra R.
+        """
+        slots = dict(self.heats)[heat_no]
+        seen: Dict[Tuple[str, ...], int] = {}
+        pattern = {}
+        for gate, slot in enumerate(slots, start=1):
+            i = seen.get(slot.color_choices, 0)
+            seen[slot.color_choices] = i + 1
+            color = slot.color_choices[i % len(slot.color_choices)]
+            pattern[str(gate)] = (COLOR_TO_TEAM[color], color)
+        return pattern
+
+
+def _compile_cell(cell: str) -> GateSlot:
+    if "/" in cell:
+        return GateSlot(None, None, None, True, tuple(cell.split("/")))
+    color, num = cell[0], int(cell[1:])
+    return GateSlot(COLOR_TO_TEAM[color], num, COLOR_TO_HELMET[color], False, ())
+
+
+def compile_schedule(name: str, rows: Iterable[Sequence]) -> CompiledSchedule:
+    heats = []
+    max_no = 0
+    for heat_no, *cells in rows:
+        slots = tuple(_compile_cell(c) for c in cells)
+        max_no = max([max_no] + [s.lineup_no for s in slots if s.lineup_no])
+        heats.append((int(heat_no), slots))
+    return CompiledSchedule(name, tuple(heats), max_no)
+
+
+SCHEDULES: Dict[str, CompiledSchedule] = {}
+DEFAULT_SCHEDULE = "elitserien_2_15_7"
+
+
+def register_schedule(name: str, rows: Iterable[Sequence]) -> CompiledSchedule:
+    """Compile and register a heat schedule under `name` (selected via meta.rules["schedule"])."""
+    compiled = compile_schedule(name, rows)
+    SCHEDULES[name] = compiled
+    return compiled
+
+
+def get_schedule(name: Optional[str] = None) -> CompiledSchedule:
+    try:
+        return SCHEDULES[name or DEFAULT_SCHEDULE]
+    except KeyError:
+        raise KeyError(f"Okänt heatschema: {name}")
+
+
+register_schedule(DEFAULT_SCHEDULE, ELITSERIEN_2_15_7)
@@ -0,0 +1,153 @@
+# scraping/bench.py
+"""
+Micro-benchmarks for the scraping layer.
+
+    python -m scraping.bench parsers <fixtures-dir> [--repeat 20] [--backend lxml ...]
+    python -m scraping.bench replay [--fixtures DIR] [--site svemo|flashscore] [--concurrency 4]
+
+`parsers` kör varje installerad parser-backend över sparade HTML-dumpar
+(*.html) och rapporterar median-tid per sida. SVEMO pages are recognised by
+the ucDrivingScheduleHeatResult marker, everything else is treated as a
+Flashscore fixture list. Outputs are compared against the first backend so a
+faster backend that extracts something different is flagged.
+
+`replay` kör en hel scrape mot fixtures inspelade med SCRAPER_FIXTURES=record
+(se replay.py) och rapporterar sidor/s, parse-tid per sida och peak RSS.
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from .parsers import SVEMO_HEAT_MARKER, available_backends, get_backend
+
+
+def _load_fixtures(directory: Path) -> List[Tuple[str, str, str]]:
+    fixtures = []
+    for path in sorted(directory.glob("*.html")):
+        html = path.read_text(encoding="utf-8", errors="replace")
+        kind = "svemo" if SVEMO_HEAT_MARKER in html else "flashscore"
+        fixtures.append((path.name, kind, html))
+    return fixtures
+
+
+def _time(fn: Callable[[], object], repeat: int) -> Tuple[float, object]:
+    samples, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples), result
+
+
+def bench_parsers(directory: Path, repeat: int, backends: List[str]) -> int:
+    fixtures = _load_fixtures(directory)
+    if not fixtures:
+        print(f"Inga *.html-fixtures i {directory}")
+        return 1
+    backends = backends or available_backends()
+    if not backends:
+        print("Ingen parser-backend installerad")
+        return 1
+
+    reference: Dict[str, object] = {}
+    totals: Dict[str, float] = {}
+    mismatches = 0
+    print(f"{'fixture':40} {'backend':12} {'median ms':>10} {'poster':>7}")
+    for name, kind, html in fixtures:
+        for backend_name in backends:
+            backend = get_backend(backend_name)
+            extract = backend.heat_tables if kind == "svemo" else backend.match_blocks
+            median, result = _time(lambda: extract(html), repeat)
+            totals[backend_name] = totals.get(backend_name, 0.0) + median
+            flag = ""
+            if name not in reference:
+                reference[name] = result
+            elif result != reference[name]:
+                flag = "  ≠ avviker från " + backends[0]
+                mismatches += 1
+            print(f"{name[:40]:40} {backend_name:12} {median * 1000:10.2f} {len(result):7d}{flag}")
+
+    print()
+    for backend_name in backends:
+        per_page = totals[backend_name] / len(fixtures)
+        print(f"{backend_name:12} snitt {per_page * 1000:8.2f} ms/sida")
+    return 1 if mismatches else 0
+
+
+def _peak_rss_mb(who: int) -> float:
+    # ru_maxrss är i kB på Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+async def _replay_site(site: str, concurrency: int) -> Dict[str, object]:
+    from . import replay
+
+    if site == "svemo":
+        from .svemo import ScrapeTimings, fetch_all_svemo_heats
+
+        timings = ScrapeTimings()
+        items = await fetch_all_svemo_heats(concurrency=concurrency, min_interval=0, known_ids=None, timings=timings)
+        parse_total = timings.totals.get("parse", 0.0)
+        parsed = timings.counts.get("parse", 0)
+    else:
+        from .flashscore import fetch_official_speedway_matches_async
+
+        items = await fetch_official_speedway_matches_async()
+        parse_total, parsed = 0.0, 0
+    return {"items": len(items), "parse_total": parse_total, "parsed": parsed, **replay.get_store().stats()}
+
+
+def bench_replay(fixtures: Path, site: str, concurrency: int) -> int:
+    os.environ["SCRAPER_FIXTURES"] = "replay"
+    os.environ["SCRAPER_FIXTURES_DIR"] = str(fixtures)
+    t0 = time.perf_counter()
+    result = asyncio.run(_replay_site(site, concurrency))
+    wall = time.perf_counter() - t0
+
+    pages = result["hits"]
+    print(f"site:              {site}")
+    print(f"dokument:          {result['items']}")
+    print(f"sidor serverade:   {pages} ({result['misses']} saknades)")
+    print(f"tid:               {wall:.2f} s")
+    print(f"sidor/s:           {pages / wall if wall else 0:.1f}")
+    if result["parsed"]:
+        print(f"parse/sida:        {result['parse_total'] / result['parsed'] * 1000:.2f} ms")
+    print(f"peak RSS python:   {_peak_rss_mb(resource.RUSAGE_SELF):.1f} MB")
+    # webbläsarprocesserna räknas först när de har avslutats
+    print(f"peak RSS barn:     {_peak_rss_mb(resource.RUSAGE_CHILDREN):.1f} MB")
+    return 1 if result["misses"] else 0
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m scraping.bench")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("parsers", help="jämför parser-backends på sparade sidor")
+    p.add_argument("fixtures", type=Path)
+    p.add_argument("--repeat", type=int, default=20)
+    p.add_argument("--backend", action="append", default=[], help="kan anges flera gånger")
+
+    r = sub.add_parser("replay", help="full scrape mot inspelade fixtures")
+    r.add_argument("--fixtures", type=Path, default=None, help="default SCRAPER_FIXTURES_DIR")
+    r.add_argument("--site", choices=("svemo", "flashscore"), default="svemo")
+    r.add_argument("--concurrency", type=int, default=4)
+
+    args = ap.parse_args(argv)
+    if args.command == "parsers":
+        return bench_parsers(args.fixtures, args.repeat, args.backend)
+    if args.command == "replay":
+        from .replay import SCRAPER_FIXTURES_DIR
+
+        return bench_replay(args.fixtures or Path(SCRAPER_FIXTURES_DIR), args.site, args.concurrency)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -287,12 +287,14 @@
 # ASYNC-VERSION
 
 # scraping/flashscore.py
-from bs4 import BeautifulSoup
 from datetime import datetime
 from typing import List, Dict, Optional
 import uuid, re
 from playwright.async_api import async_playwright, TimeoutError as PWTimeout
 
+from . import replay
+from .parsers import extract_match_blocks
+
 def _parse_date(raw: str) -> Optional[datetime]:
     m = re.search(r"\b(\d{2}\.\d{2}\.\s\d{2}:\d{2})\b", raw.replace("\xa0", " "))
     if not m:
@@ -301,8 +303,6 @@ def _parse_date(raw: str) -> Optional[datetime]:
     return dt.replace(year=datetime.now().year)
 
 async def fetch_official_speedway_matches_async() -> List[Dict]:
-    matches: List[Dict] = []
-
     async with async_playwright() as p:
         browser = await p.chromium.launch(
             headless=True,
@@ -313,6 +313,7 @@ async def fetch_official_speedway_matches_async() -> List[Dict]:
             "AppleWebKit/537.36 (KHTML, like Gecko) "
             "Chrome/120.0 Safari/537.36"
         ))
+        await replay.attach(context)
         page = await context.new_page()
 
         # 1) Navigera till sidan
@@ -358,37 +359,34 @@ async def fetch_official_speedway_matches_async() -> List[Dict]:
         await context.close()
         await browser.close()
 
-    # 6) Parsning
-    soup = BeautifulSoup(html, "html.parser")
-    match_blocks = soup.select(".event__match")
+    return parse_flashscore_html(html)
+
+
+def parse_flashscore_html(html: str, parser: Optional[str] = None) -> List[Dict]:
+    matches: List[Dict] = []
 
-    for block in match_blocks:
+    # 6) Parsning – bara .event__match-blocken parsas
+    for block in extract_match_blocks(html, parser):
         try:
-            home_el = block.select_one(".event__participant--home")
-            away_el = block.select_one(".event__participant--away")
-            time_el = block.select_one(".event__time")
-            if not (home_el and away_el and time_el):
+            home_team = block["home"]
+            away_team = block["away"]
+            date_str = block["time"]
+            if home_team is None or away_team is None or date_str is None:
                 continue
 
-            home_team = home_el.get_text(strip=True)
-            away_team = away_el.get_text(strip=True)
-            date_str = time_el.get_text(separator=" ", strip=True)
             match_dt = _parse_date(date_str)
             if not match_dt:
                 continue
 
             home_score = away_score = None
-            home_score_el = block.select_one(".event__score--home")
-            away_score_el = block.select_one(".event__score--away")
-            if home_score_el and away_score_el:
+            if block["score_home"] is not None and block["score_away"] is not None:
                 try:
-                    home_score = int(home_score_el.get_text(strip=True))
-                    away_score = int(away_score_el.get_text(strip=True))
+                    home_score = int(block["score_home"])
+                    away_score = int(block["score_away"])
                 except ValueError:
                     pass
 
-            link_tag = block.find("a", class_="eventRowLink")
-            match_url = link_tag["href"] if link_tag and link_tag.has_attr("href") else None
+            match_url = block["href"]
             if match_url and match_url.startswith("/"):
                 match_url = f"https://www.flashscore.se{match_url}"
 
@@ -0,0 +1,260 @@
+# scraping/parsers.py
+"""
+HTML extraction for the SVEMO and Flashscore scrapers.
+
+Fetch-koden lämnar över rå HTML hit och får tillbaka enkla strukturer
+(tabeller som listor av rader, matchblock som dictar), så själva tolkningen
+i svemo.py/flashscore.py är oberoende av parser. Three backends are
+supported, fastest first: selectolax, lxml and BeautifulSoup's html.parser.
+The BeautifulSoup backend only builds a tree for the relevant subtrees
+(SoupStrainer) instead of the whole page dump.
+
+Välj backend med SCRAPER_PARSER; default är den snabbaste som är installerad.
+"""
+
+import os
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+SVEMO_HEAT_MARKER = "ucDrivingScheduleHeatResult"
+
+
+class TableRow(NamedTuple):
+    cells: Tuple[str, ...]
+    first_h2: Optional[str]  # text i <h2> inuti första cellen
+    any_h2: Optional[str]    # första <h2> någonstans i raden
+
+
+# Ett heat = en tabell = lista av rader
+HeatTable = List[TableRow]
+
+# Nycklar i varje Flashscore-block
+MATCH_FIELDS = ("home", "away", "time", "score_home", "score_away", "href")
+
+
+def _join_text(parts, separator: str = "") -> str:
+    # samma semantik som bs4:s get_text(separator, strip=True)
+    return separator.join(p for p in (s.strip() for s in parts) if p)
+
+
+# ---- selectolax -------------------------------------------------------------
+
+def _sx_text(node, separator: str = "") -> str:
+    if node is None:
+        return ""
+    return _join_text(node.text(deep=True, separator="\x00", strip=False).split("\x00"), separator)
+
+
+def _sx_unique(nodes):
+    seen, out = set(), []
+    for n in nodes:
+        key = getattr(n, "mem_id", id(n))
+        if key not in seen:
+            seen.add(key)
+            out.append(n)
+    return out
+
+
+def _sx_parse(html: str):
+    # Lexbor finns från 0.3 och är den enda motorn i selectolax 1.0;
+    # äldre installationer har bara Modest (selectolax.parser)
+    try:
+        from selectolax.lexbor import LexborHTMLParser as HTMLParser
+    except ImportError:
+        from selectolax.parser import HTMLParser
+    return HTMLParser(html)
+
+
+def _sx_heat_tables(html: str) -> List[HeatTable]:
+    tree = _sx_parse(html)
+    tables: List[HeatTable] = []
+    for table in _sx_unique(tree.css(f"div[id*={SVEMO_HEAT_MARKER}] table.rgMasterTable")):
+        rows: HeatTable = []
+        for tr in table.css("tbody > tr"):
+            tds = tr.css("td")
+            h2_first = tds[0].css_first("h2") if tds else None
+            h2_any = tr.css_first("h2")
+            rows.append(TableRow(
+                tuple(_sx_text(td) for td in tds),
+                _sx_text(h2_first) if h2_first is not None else None,
+                _sx_text(h2_any) if h2_any is not None else None,
+            ))
+        tables.append(rows)
+    return tables
+
+
+def _sx_match_blocks(html: str) -> List[Dict[str, Optional[str]]]:
+    tree = _sx_parse(html)
+    blocks = []
+    for block in tree.css(".event__match"):
+        def first(sel: str, sep: str = "") -> Optional[str]:
+            node = block.css_first(sel)
+            return _sx_text(node, sep) if node is not None else None
+
+        link = block.css_first("a.eventRowLink")
+        blocks.append(_match_block(first, link.attributes.get("href") if link is not None else None))
+    return blocks
+
+
+# ---- lxml -------------------------------------------------------------------
+
+def _has_class(cls: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')"
+
+
+def _lx_text(el, separator: str = "") -> str:
+    return _join_text(el.itertext(), separator)
+
+
+def _lx_heat_tables(html: str) -> List[HeatTable]:
+    import lxml.html
+
+    root = lxml.html.fromstring(html)
+    found = root.xpath(
+        f"//div[contains(@id, '{SVEMO_HEAT_MARKER}')]//table[{_has_class('rgMasterTable')}]"
+    )
+    seen, tables = set(), []
+    for table in found:
+        if table in seen:
+            continue
+        seen.add(table)
+        rows: HeatTable = []
+        for tr in table.xpath(".//tbody/tr"):
+            tds = tr.xpath(".//td")
+            h2_first = tds[0].xpath(".//h2") if tds else []
+            h2_any = tr.xpath(".//h2")
+            rows.append(TableRow(
+                tuple(_lx_text(td) for td in tds),
+                _lx_text(h2_first[0]) if h2_first else None,
+                _lx_text(h2_any[0]) if h2_any else None,
+            ))
+        tables.append(rows)
+    return tables
+
+
+def _lx_match_blocks(html: str) -> List[Dict[str, Optional[str]]]:
+    import lxml.html
+
+    root = lxml.html.fromstring(html)
+    blocks = []
+    for block in root.xpath(f"//*[{_has_class('event__match')}]"):
+        def first(sel: str, sep: str = "") -> Optional[str]:
+            # sel är alltid en enkel klasselektor (".event__...")
+            found = block.xpath(f".//*[{_has_class(sel.lstrip('.'))}]")
+            return _lx_text(found[0], sep) if found else None
+
+        link = block.xpath(f".//a[{_has_class('eventRowLink')}]")
+        blocks.append(_match_block(first, link[0].get("href") if link else None))
+    return blocks
+
+
+# ---- BeautifulSoup (html.parser) -------------------------------------------
+
+def _bs_heat_tables(html: str) -> List[HeatTable]:
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    only = SoupStrainer("div", id=re.compile(SVEMO_HEAT_MARKER))
+    soup = BeautifulSoup(html, "html.parser", parse_only=only)
+    tables: List[HeatTable] = []
+    for table in soup.select(f"div[id*={SVEMO_HEAT_MARKER}] table.rgMasterTable"):
+        rows: HeatTable = []
+        for tr in table.select("tbody > tr"):
+            tds = tr.find_all("td")
+            h2_first = tds[0].find("h2") if tds else None
+            h2_any = tr.find("h2")
+            rows.append(TableRow(
+                tuple(td.get_text(strip=True) for td in tds),
+                h2_first.get_text(strip=True) if h2_first else None,
+                h2_any.get_text(strip=True) if h2_any else None,
+            ))
+        tables.append(rows)
+    return tables
+
+
+def _bs_match_blocks(html: str) -> List[Dict[str, Optional[str]]]:
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    soup = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer(class_="event__match"))
+    blocks = []
+    for block in soup.select(".event__match"):
+        def first(sel: str, sep: str = "") -> Optional[str]:
+            el = block.select_one(sel)
+            return el.get_text(separator=sep, strip=True) if el else None
+
+        link = block.find("a", class_="eventRowLink")
+        blocks.append(_match_block(first, link.get("href") if link else None))
+    return blocks
+
+
+def _match_block(first: Callable[..., Optional[str]], href: Optional[str]) -> Dict[str, Optional[str]]:
+    return {
+        "home": first(".event__participant--home"),
+        "away": first(".event__participant--away"),
+        "time": first(".event__time", " "),
+        "score_home": first(".event__score--home"),
+        "score_away": first(".event__score--away"),
+        "href": href,
+    }
+
+
+# ---- registry ---------------------------------------------------------------
+
+class ParserBackend(NamedTuple):
+    name: str
+    module: str  # modul som måste gå att importera
+    heat_tables: Callable[[str], List[HeatTable]]
+    match_blocks: Callable[[str], List[Dict[str, Optional[str]]]]
+
+
+BACKENDS: Dict[str, ParserBackend] = {
+    "selectolax": ParserBackend("selectolax", "selectolax", _sx_heat_tables, _sx_match_blocks),
+    "lxml": ParserBackend("lxml", "lxml.html", _lx_heat_tables, _lx_match_blocks),
+    "html.parser": ParserBackend("html.parser", "bs4", _bs_heat_tables, _bs_match_blocks),
+}
+
+
+def available_backends() -> List[str]:
+    import importlib
+
+    names = []
+    for name, backend in BACKENDS.items():
+        try:
+            importlib.import_module(backend.module)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+_default: Optional[ParserBackend] = None
+
+
+def get_backend(name: Optional[str] = None) -> ParserBackend:
+    """
+    Backend by name, or the configured default (SCRAPER_PARSER, otherwise
+    the first installed one in BACKENDS order). Raises KeyError/ImportError
+    for unknown or uninstalled names.
+    """
+    global _default
+    if name is None:
+        if _default is None:
+            wanted = os.getenv("SCRAPER_PARSER")
+            if wanted:
+                _default = get_backend(wanted)
+            else:
+                installed = available_backends()
+                if not installed:
+                    raise ImportError("Ingen HTML-parser installerad (selectolax, lxml eller bs4)")
+                _default = BACKENDS[installed[0]]
+        return _default
+    backend = BACKENDS[name]
+    __import__(backend.module)
+    return backend
+
+
+def extract_heat_tables(html: str, backend: Optional[str] = None) -> List[HeatTable]:
+    return get_backend(backend).heat_tables(html)
+
+
+def extract_match_blocks(html: str, backend: Optional[str] = None) -> List[Dict[str, Optional[str]]]:
+    return get_backend(backend).match_blocks(html)
@@ -0,0 +1,45 @@
+# scraping/pipeline.py
+"""
+Producer/worker orchestration shared by the scrapers (bara asyncio, inga
+scraper-beroenden).
+
+`run_pipeline` kör en producent som fyller en begränsad kö och `concurrency`
+arbetare som tömmer den. The first task that fails cancels the others and its
+exception is re-raised, so a crashed worker can never leave the producer
+blocked on a full queue. Cancelling `run_pipeline` itself returns promptly
+as well: end-of-queue sentinels are only sent after the producer finished
+normally, never from a cancelled task.
+"""
+
+import asyncio
+from typing import Awaitable, Callable
+
+Produce = Callable[[asyncio.Queue], Awaitable[None]]
+Work = Callable[[asyncio.Queue], Awaitable[None]]
+
+
+async def run_pipeline(produce: Produce, work: Work, concurrency: int, maxsize: int = 0) -> None:
+    """
+    `produce(todo)` puts items on `todo`; each `work(todo)` takes items until
+    it gets None. Returns when the producer and every worker are done.
+    """
+    todo: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    async def producer() -> None:
+        await produce(todo)
+        # bara vid normalt slut – en avbruten producent får inte blockera på kön
+        for _ in range(concurrency):
+            await todo.put(None)
+
+    tasks = [asyncio.create_task(producer())] + [
+        asyncio.create_task(work(todo)) for _ in range(concurrency)
+    ]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
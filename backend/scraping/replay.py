@@ -0,0 +1,176 @@
+# scraping/replay.py
+"""
+Record/replay of scraper traffic against a local fixture directory.
+
+    SCRAPER_FIXTURES=record  # hämta live och spara varje svar
+    SCRAPER_FIXTURES=replay  # servera sparade svar, inget nätverk
+    SCRAPER_FIXTURES_DIR=... # default scraping/fixtures
+
+Both transports the scrapers use are covered: Playwright contexts get a
+`context.route` handler (`attach`) and httpx clients get a transport
+(`http_transport`). Svar nycklas på metod + URL + request-body, så även
+RadGrids postback-paginering spelas upp så länge sidorna är deterministiska.
+
+With SCRAPER_FIXTURES=off (default) `attach` installs nothing, so live
+scrapes keep Playwright's normal request handling and cache. Blocking images,
+fonts and media is a separate opt-in (SCRAPER_BLOCK_RESOURCES=1 or
+`attach(context, block_resources=True)`).
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+FIXTURE_MODES = ("off", "record", "replay")
+SCRAPER_FIXTURES = os.getenv("SCRAPER_FIXTURES", "off")
+SCRAPER_FIXTURES_DIR = os.getenv("SCRAPER_FIXTURES_DIR", str(Path(__file__).parent / "fixtures"))
+
+SCRAPER_BLOCK_RESOURCES = os.getenv("SCRAPER_BLOCK_RESOURCES", "0") == "1"
+
+BLOCKED_RESOURCES = {"image", "font", "media"}
+
+
+class FixtureStore:
+    """One `<key>.json` (status, headers, url) plus `<key>.body` per response."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = Path(directory)
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self.bytes_served = 0
+
+    @staticmethod
+    def key(method: str, url: str, body: Optional[bytes] = None) -> str:
+        h = hashlib.sha1(f"{method.upper()} {url}".encode("utf-8"))
+        if body:
+            h.update(b"\0")
+            h.update(body)
+        return h.hexdigest()
+
+    def save(self, method: str, url: str, body: Optional[bytes], status: int,
+             headers: Dict[str, str], content: bytes) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        key = self.key(method, url, body)
+        # bara content-type behövs för att spela upp HTML korrekt
+        kept = {k: v for k, v in headers.items() if k.lower() == "content-type"}
+        meta = {"method": method.upper(), "url": url, "status": status, "headers": kept}
+        (self.directory / f"{key}.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        (self.directory / f"{key}.body").write_bytes(content)
+        self.recorded += 1
+
+    def load(self, method: str, url: str, body: Optional[bytes] = None) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        key = self.key(method, url, body)
+        meta_path = self.directory / f"{key}.json"
+        if not meta_path.exists():
+            self.misses += 1
+            return None
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        content = (self.directory / f"{key}.body").read_bytes()
+        self.hits += 1
+        self.bytes_served += len(content)
+        return meta["status"], meta.get("headers") or {}, content
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "recorded": self.recorded,
+            "bytes_served": self.bytes_served,
+        }
+
+
+_stores: Dict[str, FixtureStore] = {}
+
+
+def fixture_mode() -> str:
+    mode = os.getenv("SCRAPER_FIXTURES", SCRAPER_FIXTURES)
+    if mode not in FIXTURE_MODES:
+        raise ValueError(f"SCRAPER_FIXTURES måste vara en av {FIXTURE_MODES}")
+    return mode
+
+
+def get_store() -> FixtureStore:
+    directory = os.getenv("SCRAPER_FIXTURES_DIR", SCRAPER_FIXTURES_DIR)
+    if directory not in _stores:
+        _stores[directory] = FixtureStore(directory)
+    return _stores[directory]
+
+
+# ---- Playwright -------------------------------------------------------------
+
+async def attach(context, block_resources: bool = SCRAPER_BLOCK_RESOURCES) -> None:
+    """
+    Install the route handler on a Playwright browser context. No-op when
+    fixtures are off and resource blocking is not requested.
+    """
+    mode = fixture_mode()
+    if mode == "off" and not block_resources:
+        return
+    store = get_store() if mode != "off" else None
+
+    async def handler(route) -> None:
+        request = route.request
+        if block_resources and request.resource_type in BLOCKED_RESOURCES:
+            await route.abort()
+            return
+        if store is None:
+            await route.continue_()
+            return
+        body = request.post_data_buffer
+        if mode == "replay":
+            hit = store.load(request.method, request.url, body)
+            if hit is None:
+                print(f"[REPLAY] saknas: {request.method} {request.url}")
+                await route.abort()
+                return
+            status, headers, content = hit
+            await route.fulfill(status=status, headers=headers, body=content)
+            return
+        response = await route.fetch()
+        content = await response.body()
+        store.save(request.method, request.url, body, response.status, response.headers, content)
+        await route.fulfill(response=response, body=content)
+
+    await context.route("**/*", handler)
+
+
+# ---- httpx ------------------------------------------------------------------
+
+class FixtureTransport(httpx.AsyncBaseTransport):
+    def __init__(self, mode: str, store: FixtureStore, inner: Optional[httpx.AsyncBaseTransport] = None) -> None:
+        self.mode = mode
+        self.store = store
+        self.inner = inner or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        url = str(request.url)
+        if self.mode == "replay":
+            hit = self.store.load(request.method, url, body)
+            if hit is None:
+                print(f"[REPLAY] saknas: {request.method} {url}")
+                return httpx.Response(404, request=request)
+            status, headers, content = hit
+            return httpx.Response(status, headers=headers, content=content, request=request)
+        response = await self.inner.handle_async_request(request)
+        content = await response.aread()
+        self.store.save(request.method, url, body, response.status_code, dict(response.headers), content)
+        headers = {k: v for k, v in response.headers.items()
+                   if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")}
+        return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+def http_transport(**transport_kwargs) -> Optional[httpx.AsyncBaseTransport]:
+    """Transport for httpx clients, or None when fixtures are off (use httpx' default)."""
+    mode = fixture_mode()
+    if mode == "off":
+        return None
+    return FixtureTransport(mode, get_store(), httpx.AsyncHTTPTransport(**transport_kwargs))
@@ -287,143 +287,392 @@
 
 
 
+import asyncio
+import os
 import re
+import time
+from contextlib import contextmanager
 from uuid import uuid4
-from typing import Optional, Dict, List
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from typing import AbstractSet, AsyncIterator, Callable, Optional, Dict, List
+from urllib.parse import urljoin, urlparse
 from datetime import datetime
+import httpx
 from playwright.async_api import async_playwright, TimeoutError as PWTimeout
 
+from . import replay
+from .parsers import extract_heat_tables
+from .pipeline import run_pipeline
+
 BASE_URL = "https://ta.svemo.se"
 LISTING_URL = "https://www.svemo.se/vara-sportgrenar/start-speedway/resultat-speedway/resultat-bauhausligan-speedway"
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
 }
 
+# Antal samtidiga detaljsidor och minsta tid mellan två anrop mot samma host
+SVEMO_CONCURRENCY = int(os.getenv("SVEMO_CONCURRENCY", "4"))
+SVEMO_MIN_INTERVAL = float(os.getenv("SVEMO_MIN_INTERVAL", "0.5"))
+# "auto": httpx först, Playwright om statisk HTML saknar heat-tabellerna;
+# "http": bara httpx; "playwright": alltid webbläsare för detaljsidor
+SVEMO_FETCH_MODE = os.getenv("SVEMO_FETCH_MODE", "auto")
+FETCH_MODES = ("auto", "http", "playwright")
+
+HEAT_TABLE_MARKER = "ucDrivingScheduleHeatResult"
+
+_DONE = object()
+
+GRID_TIMEOUT_MS = int(os.getenv("SVEMO_GRID_TIMEOUT_MS", "20000"))
+
+# Signatur för aktuell grid-sida: första radens länk + RadGrids sidindikator.
+# Ändras den efter ett klick på "Nästa" har griden laddats om.
+_GRID_SIGNATURE_JS = """
+() => {
+  const a = document.querySelector("table.rgMasterTable > tbody > tr > td:nth-child(4) a");
+  const cur = document.querySelector(".rgCurrentPage");
+  return (a ? a.getAttribute("href") : "") + "|" + (cur ? cur.textContent.trim() : "");
+}
+"""
+
+
+class ScrapeTimings:
+    """Accumulated wall time per scrape phase (detail pages are summed over workers)."""
 
-async def fetch_all_svemo_heats() -> List[Dict]:
-    
+    def __init__(self) -> None:
+        self.totals: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self._t0 = time.monotonic()
+
+    @contextmanager
+    def measure(self, phase: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.totals[phase] = self.totals.get(phase, 0.0) + time.monotonic() - start
+            self.counts[phase] = self.counts.get(phase, 0) + 1
+
+    def report(self) -> str:
+        lines = [f"[TIMING] Totalt: {time.monotonic() - self._t0:.2f}s"]
+        for phase, total in self.totals.items():
+            n = self.counts[phase]
+            lines.append(f"[TIMING]   {phase}: {total:.2f}s över {n} st (snitt {total / n:.3f}s)")
+        return "\n".join(lines)
+
+
+class HostRateLimiter:
+    """Spacing between requests per host, shared by all pages in the pool."""
+
+    def __init__(self, min_interval: float) -> None:
+        self.min_interval = min_interval
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._last: Dict[str, float] = {}
+
+    async def wait(self, url: str) -> None:
+        if self.min_interval <= 0:
+            return
+        host = urlparse(url).netloc
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            delay = self._last.get(host, 0.0) + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._last[host] = time.monotonic()
+
+
+async def fetch_all_svemo_heats(
+    concurrency: int = SVEMO_CONCURRENCY,
+    min_interval: float = SVEMO_MIN_INTERVAL,
+    known_ids: Optional[AbstractSet[int]] = None,
+    fetch_mode: str = SVEMO_FETCH_MODE,
+    timings: Optional[ScrapeTimings] = None,
+    on_item: Optional[Callable[[Dict], None]] = None,
+) -> List[Dict]:
+    """Collect iter_svemo_heats; `on_item` is called for each document as it arrives."""
+    timings = timings or ScrapeTimings()
     all_matches = []
-    seen_ids = set()
+    async for m in iter_svemo_heats(
+        concurrency, min_interval, timings=timings, known_ids=known_ids, fetch_mode=fetch_mode
+    ):
+        all_matches.append(m)
+        if on_item:
+            on_item(m)
+    print(f"[DONE] Totalt antal heatmatcher: {len(all_matches)}")
+    print(timings.report())
+    return all_matches
+
 
-    async with async_playwright() as p:
+async def iter_svemo_heats(
+    concurrency: int = SVEMO_CONCURRENCY,
+    min_interval: float = SVEMO_MIN_INTERVAL,
+    timings: Optional[ScrapeTimings] = None,
+    known_ids: Optional[AbstractSet[int]] = None,
+    fetch_mode: str = SVEMO_FETCH_MODE,
+) -> AsyncIterator[Dict]:
+    """
+    Stream heat documents as competitions finish scraping.
+
+    Listningssidan pagineras i en egen task som lägger tävlings-URL:er på en
+    kö; `concurrency` arbetare med var sin återanvänd sida i samma
+    browser-context plockar från kön. Requests to the same host are spaced by
+    `min_interval` seconds.
+
+    Competitions in `known_ids` are not scraped, and pagination stops at the
+    first listing page that contains only known competitions.
+
+    Detail pages are fetched according to `fetch_mode` (see SVEMO_FETCH_MODE);
+    the listing always needs the browser since RadGrid paginates via postback.
+    """
+    if fetch_mode not in FETCH_MODES:
+        raise ValueError(f"fetch_mode måste vara en av {FETCH_MODES}")
+    concurrency = max(1, concurrency)
+    timings = timings or ScrapeTimings()
+
+    async with async_playwright() as p, _http_client(concurrency) as client:
         browser = await p.chromium.launch(headless=True)
         context = await browser.new_context(user_agent=HEADERS["User-Agent"])
-        page = await context.new_page()
+        await replay.attach(context)
 
-        print(f"[INFO] Går till startsida: {LISTING_URL}")
-        await page.goto(LISTING_URL, timeout=60000)
-        await page.wait_for_load_state("networkidle")
-        await page.wait_for_timeout(3000)
+        results: asyncio.Queue = asyncio.Queue()
+        limiter = HostRateLimiter(min_interval)
 
-        frames = page.frames
-        print(f"[DEBUG] Antal iframes: {len(frames)}")
+        async def worker(todo: asyncio.Queue) -> None:
+            page = None  # skapas först när en detaljsida behöver webbläsaren
+            try:
+                while True:
+                    item = await todo.get()
+                    if item is None:
+                        break
+                    url, competition_id = item
+                    with timings.measure("rate-limit"):
+                        await limiter.wait(url)
+                    heat_data = None
+                    try:
+                        if fetch_mode != "playwright":
+                            with timings.measure("detail-sida (http)"):
+                                heat_data = await scrape_svemo_heat_page_http(client, url, competition_id, timings)
+                        if heat_data is None and fetch_mode != "http":
+                            if page is None:
+                                page = await context.new_page()
+                            if fetch_mode != "playwright":
+                                # http-försöket har redan gått mot samma värd
+                                with timings.measure("rate-limit"):
+                                    await limiter.wait(url)
+                            with timings.measure("detail-sida (playwright)"):
+                                heat_data = await scrape_svemo_heat_page_playwright(
+                                    context, url, competition_id, page=page, timings=timings
+                                )
+                    except Exception as e:
+                        print(f"[WARN] ❌ Fel vid skrapning av {url}: {e}")
+                        heat_data = None
+                    if heat_data:
+                        await results.put(heat_data)
+            finally:
+                if page is not None:
+                    await page.close()
+
+        async def producer(todo: asyncio.Queue) -> None:
+            await _enqueue_listing(context, todo, timings, known_ids or frozenset())
+
+        async def run() -> None:
+            try:
+                await run_pipeline(producer, worker, concurrency, maxsize=concurrency * 2)
+            finally:
+                await results.put(_DONE)
+
+        runner = asyncio.create_task(run())
+        try:
+            while True:
+                item = await results.get()
+                if item is _DONE:
+                    break
+                yield item
+            await runner  # bubbla upp ev. fel från listningen
+        finally:
+            if not runner.done():
+                runner.cancel()
+                try:
+                    await runner
+                except (asyncio.CancelledError, Exception):
+                    pass
+            await browser.close()
 
-        target_frame = None
-        for i, frame in enumerate(frames):
+
+async def _find_grid_frame(page, timeout_ms: int = GRID_TIMEOUT_MS):
+    """Poll the page's frames until one contains the RadGrid table."""
+    deadline = time.monotonic() + timeout_ms / 1000
+    while True:
+        for i, frame in enumerate(page.frames):
             try:
-                content = await frame.content()
-                if "rgMasterTable" in content:
+                if await frame.query_selector("table.rgMasterTable > tbody > tr"):
                     print(f"[✅] Tabellen hittades i iframe index {i}")
-                    target_frame = frame
-                    break
-            except Exception as e:
-                print(f"[WARN] Kunde inte läsa frame {i}: {e}")
+                    return frame
+            except Exception:
+                # frame kan ha navigerats bort under tiden
+                continue
+        if time.monotonic() >= deadline:
+            return None
+        await asyncio.sleep(0.1)
 
-        if not target_frame:
-            print("[ERROR] ❌ Ingen iframe innehöll tabellen.")
-            return []
 
-        # Hämta total antal sidor
-        page_info_text = await target_frame.locator("div.rgWrap.rgInfoPart").inner_text()
-        match = re.search(r"(\d+)\s+pages", page_info_text)
-        max_pages = int(match.group(1)) if match else 1
-        print(f"[INFO] Totalt antal sidor: {max_pages}")
+async def _enqueue_listing(context, todo: asyncio.Queue, timings: ScrapeTimings,
+                           known_ids: AbstractSet[int]) -> None:
+    seen_ids = set()
+    skipped_known = 0
+    page = await context.new_page()
 
-        current_page = 1
-        while True:
-            try:
-                await target_frame.wait_for_selector("table.rgMasterTable > tbody > tr", timeout=15000)
-            except PWTimeout:
-                print("[ERROR] ❌ Timeout vid tabellrader.")
-                break
+    print(f"[INFO] Går till startsida: {LISTING_URL}")
+    with timings.measure("startsida"):
+        await page.goto(LISTING_URL, timeout=60000, wait_until="domcontentloaded")
+        target_frame = await _find_grid_frame(page)
 
-            rows = target_frame.locator("table.rgMasterTable > tbody > tr")
-            row_count = await rows.count()
-            print(f"[INFO] Rader hittade i iframe-tabell: {row_count}")
-
-            new_ids_found = False
-            for i in range(row_count):
-                row = rows.nth(i)
-                link = row.locator("td >> nth=3 >> a")
-                if await link.count() == 0:
-                    continue
-
-                heat_url = await link.get_attribute("href")
-                if not heat_url:
-                    continue
-
-                full_url = urljoin(BASE_URL, heat_url)
-                comp_id_match = re.search(r"CompetitionId=(\d+)", full_url)
-                if not comp_id_match:
-                    continue
-
-                competition_id = int(comp_id_match.group(1))
-                if competition_id in seen_ids:
-                    continue
-
-                seen_ids.add(competition_id)
-                new_ids_found = True
-
-                print(f"[INFO] Skrapar: {full_url}")
-                heat_data = await scrape_svemo_heat_page_playwright(context, full_url, competition_id)
-                if heat_data:
-                    all_matches.append(heat_data)
-
-            # Stoppvillkor: inga nya ID:n eller nått sista sidan
-            if not new_ids_found:
-                print("[INFO] 🚫 Inga nya tävlingar hittades – avbryter.")
-                break
-            if current_page >= max_pages:
-                print(f"[INFO] ✅ Alla {max_pages} sidor besökta – klart.")
-                break
+    if not target_frame:
+        print("[ERROR] ❌ Ingen iframe innehöll tabellen.")
+        await page.close()
+        return
+
+    # Hämta total antal sidor
+    page_info_text = await target_frame.locator("div.rgWrap.rgInfoPart").inner_text()
+    match = re.search(r"(\d+)\s+pages", page_info_text)
+    max_pages = int(match.group(1)) if match else 1
+    print(f"[INFO] Totalt antal sidor: {max_pages}")
+
+    current_page = 1
+    while True:
+        rows = target_frame.locator("table.rgMasterTable > tbody > tr")
+        row_count = await rows.count()
+        print(f"[INFO] Rader hittade i iframe-tabell: {row_count}")
+
+        new_ids_found = False
+        unknown_found = False
+        for i in range(row_count):
+            row = rows.nth(i)
+            link = row.locator("td >> nth=3 >> a")
+            if await link.count() == 0:
+                continue
 
-            # Klicka på "Nästa sida"-knappen
-            try:
-                next_button = target_frame.locator("input.rgPageNext")
-                if await next_button.is_disabled():
-                    print("[INFO] 🛑 Nästa-knapp är inaktiverad – slut på sidor.")
-                    break
+            heat_url = await link.get_attribute("href")
+            if not heat_url:
+                continue
 
-                print("[INFO] ⏭️ Går till nästa sida...")
-                await next_button.click()
-                await target_frame.wait_for_load_state("networkidle")
-                await page.wait_for_timeout(3000)
-                current_page += 1
+            full_url = urljoin(BASE_URL, heat_url)
+            comp_id_match = re.search(r"CompetitionId=(\d+)", full_url)
+            if not comp_id_match:
+                continue
 
-            except Exception as e:
-                print(f"[ERROR] ❌ Kunde inte klicka vidare: {e}")
+            competition_id = int(comp_id_match.group(1))
+            if competition_id in seen_ids:
+                continue
+
+            seen_ids.add(competition_id)
+            new_ids_found = True
+            if competition_id in known_ids:
+                skipped_known += 1
+                continue
+            unknown_found = True
+
+            print(f"[INFO] Köar: {full_url}")
+            await todo.put((full_url, competition_id))
+
+        # Stoppvillkor: inga nya ID:n eller nått sista sidan
+        if not new_ids_found:
+            print("[INFO] 🚫 Inga nya tävlingar hittades – avbryter.")
+            break
+        if known_ids and not unknown_found:
+            # listan är sorterad nyast först – resten är redan importerat
+            print("[INFO] ⏹️ Hela sidan innehöll redan kända tävlingar – avbryter.")
+            break
+        if current_page >= max_pages:
+            print(f"[INFO] ✅ Alla {max_pages} sidor besökta – klart.")
+            break
+
+        # Klicka på "Nästa sida"-knappen
+        try:
+            next_button = target_frame.locator("input.rgPageNext")
+            if await next_button.is_disabled():
+                print("[INFO] 🛑 Nästa-knapp är inaktiverad – slut på sidor.")
                 break
 
-        await browser.close()
+            print("[INFO] ⏭️ Går till nästa sida...")
+            with timings.measure("paginering"):
+                before = await target_frame.evaluate(_GRID_SIGNATURE_JS)
+                await next_button.click()
+                # vänta tills griden faktiskt bytt innehåll i stället för en fast paus
+                await target_frame.wait_for_function(
+                    f"(prev) => ({_GRID_SIGNATURE_JS})() !== prev",
+                    arg=before,
+                    timeout=GRID_TIMEOUT_MS,
+                )
+            current_page += 1
+
+        except PWTimeout:
+            print("[ERROR] ❌ Timeout – griden uppdaterades inte efter klick.")
+            break
+        except Exception as e:
+            print(f"[ERROR] ❌ Kunde inte klicka vidare: {e}")
+            break
+
+    if skipped_known:
+        print(f"[INFO] Hoppade över {skipped_known} redan kända tävlingar")
+    await page.close()
 
-    print(f"[DONE] Totalt antal heatmatcher: {len(all_matches)}")
-    return all_matches
 
 
 
 
 
+def _http_client(concurrency: int) -> httpx.AsyncClient:
+    """One pooled client per scrape run, sized to the worker count."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    return httpx.AsyncClient(
+        headers=HEADERS,
+        follow_redirects=True,
+        timeout=httpx.Timeout(30.0, connect=10.0),
+        limits=limits,
+        transport=replay.http_transport(limits=limits),
+    )
 
-async def scrape_svemo_heat_page_playwright(context, url: str, competition_id: int) -> Optional[dict]:
 
+def _parse_timed(html: str, url: str, competition_id: int, timings: Optional[ScrapeTimings]) -> Optional[dict]:
+    if timings is None:
+        return parse_svemo_heat_html(html, url, competition_id)
+    with timings.measure("parse"):
+        return parse_svemo_heat_html(html, url, competition_id)
+
+
+async def scrape_svemo_heat_page_http(client: httpx.AsyncClient, url: str, competition_id: int,
+                                      timings: Optional[ScrapeTimings] = None) -> Optional[dict]:
+    """
+    Hämta en tävlingssida utan webbläsare. Returns None when the response is
+    not usable as static HTML (error status or no heat tables rendered
+    server-side) so the caller can fall back to Playwright.
+    """
+    print(f"[INFO] 🧪 Skrapar heatresultat (via HTTP): {url}")
+    try:
+        resp = await client.get(url)
+    except httpx.HTTPError as e:
+        print(f"[WARN] HTTP-fel för {url}: {e}")
+        return None
+    if resp.status_code != 200 or HEAT_TABLE_MARKER not in resp.text:
+        return None
+    return _parse_timed(resp.text, url, competition_id, timings)
+
+
+async def scrape_svemo_heat_page_playwright(context, url: str, competition_id: int, page=None,
+                                            timings: Optional[ScrapeTimings] = None) -> Optional[dict]:
+    """
+    Scrape one competition page. Pass `page` to reuse a pooled page; it is
+    then left open for the caller, otherwise a new page is opened and closed.
+    """
     print(f"[INFO] 🧪 Skrapar heatresultat (via Playwright): {url}")
-    page = await context.new_page()
+    owns_page = page is None
+    if owns_page:
+        page = await context.new_page()
 
     try:
-        await page.goto(url, timeout=60000)
+        # tabellen är signalen – vänta inte på load/networkidle
+        await page.goto(url, timeout=60000, wait_until="domcontentloaded")
         await page.wait_for_selector("div[id*=ucDrivingScheduleHeatResult] table.rgMasterTable", timeout=15000)
+        html = await page.content()
     except Exception as e:
         print(f"[WARN] ❌ Timeout eller fel på sidan: {url} – {e}")
         try:
@@ -431,40 +680,37 @@ async def scrape_svemo_heat_page_playwright(context, url: str, competition_id: i
                 f.write(await page.content())
         except Exception:
             pass
-        await page.close()
         return None
+    finally:
+        if owns_page:
+            await page.close()
+
+    return _parse_timed(html, url, competition_id, timings)
 
-    html = await page.content()
-    await page.close()
-    soup = BeautifulSoup(html, "html.parser")
 
-    # En tabell per heat
-    heat_tables = soup.select("div[id*=ucDrivingScheduleHeatResult] table.rgMasterTable")
+def parse_svemo_heat_html(html: str, url: str, competition_id: int, parser: Optional[str] = None) -> Optional[dict]:
+    # En tabell per heat – bara ucDrivingScheduleHeatResult-delen parsas
+    heat_tables = extract_heat_tables(html, parser)
     all_heats: List[Dict] = []
     seen_heat_numbers: set[int] = set()
 
-    for table in heat_tables:
-        rows = table.select("tbody > tr")
+    for rows in heat_tables:
         if not rows:
             continue
 
         # 1) Hitta heat-numret på säkrast möjliga sätt:
         heat_number = None
-        first_row_cells = rows[0].find_all("td")
-        if first_row_cells:
-            h2 = first_row_cells[0].find("h2")
-            if h2:
-                try:
-                    heat_number = int(h2.get_text(strip=True))
-                except Exception:
-                    heat_number = None
+        if rows[0].first_h2 is not None:
+            try:
+                heat_number = int(rows[0].first_h2)
+            except Exception:
+                heat_number = None
 
         if heat_number is None:
             # fallback: leta första h2 i första raden
-            h2_any = rows[0].find("h2")
-            if h2_any:
+            if rows[0].any_h2 is not None:
                 try:
-                    heat_number = int(h2_any.get_text(strip=True))
+                    heat_number = int(rows[0].any_h2)
                 except Exception:
                     pass
 
@@ -482,12 +728,12 @@ async def scrape_svemo_heat_page_playwright(context, url: str, competition_id: i
         # 2) Läs exakt de fyra förarraderna i heat-tabellen
         #    (RadGrid lägger alltid 4 rader per heat – med tomma celler vid behov)
         for idx, row in enumerate(rows[:4]):
-            cells = row.find_all("td")
+            cells = row.cells
             if not cells:
                 continue
 
             # Om första cellen är heatnumret, kasta bort den så vi börjar på Huvafältet
-            if idx == 0 and cells[0].find("h2"):
+            if idx == 0 and row.first_h2 is not None:
                 cells = cells[1:]
 
             # Vi behöver 7 celler: Huvafärg, Spår, Förare, Lag, Status, Ersättare, Poäng
@@ -496,7 +742,7 @@ async def scrape_svemo_heat_page_playwright(context, url: str, competition_id: i
                 continue
 
             # Läs strikt de första 7 cellerna – ignorera HEAT/TOTAL längre till höger
-            c = [cells[i].get_text(strip=True) for i in range(7)]
+            c = list(cells[:7])
 
             helmet_color = c[0]
             gate_text = c[1]
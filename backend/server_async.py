@@ -22,7 +22,7 @@ from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Dict, Any
 from bson import ObjectId
 
-from fastapi import FastAPI, HTTPException, Depends, status, Body, APIRouter, Request
+from fastapi import FastAPI, HTTPException, Depends, status, Body, APIRouter, Request, Response, Query
 
 from pydantic import BaseModel, Field
 
@@ -32,19 +32,38 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from motor.motor_asyncio import AsyncIOMotorClient
 import jwt
-import bcrypt
-from helpers.schedule_elit import ELITSERIEN_2_15_7, COLOR_TO_TEAM, COLOR_TO_HELMET
+from helpers.schedule_elit import COLOR_TO_HELMET, SCHEDULES, CompiledSchedule, get_schedule
+from helpers.match_keys import build_match_key
 from services.meta_rules import DEFAULT_RULES
+from services.session_cache import session_cache
+from services.roster_cache import roster_cache
+from services.team_resolver import team_resolver
+from services.jobs import job_runner
+from services import metrics
+from services.indexes import apply_indexes
+from services.migrations import run_migrations, backfill_match_keys as _backfill_match_keys, MigrationContext
+from services.passwords import hash_password_async, verify_password_async, needs_rehash
+from services import passwords
+from services.scoring import score_heat, heat_points, has_stored_points, missing_points, team_scores_upto, match_totals
 from config import FRONTEND_ORIGINS, MONGO_URL
-from pymongo.errors import DuplicateKeyError, OperationFailure # lägg till högst upp bland imports
+from pymongo.errors import DuplicateKeyError # lägg till högst upp bland imports
 
 import unicodedata  # NEW
 import hashlib, json, re  # NEW
  
-try:
-    import pyotp   # valfritt för TOTP 2FA
-except Exception:
-    pyotp = None
+_pyotp_module: Any = None
+
+
+def _pyotp():
+    """pyotp (valfritt, för TOTP 2FA) importeras först när 2FA används."""
+    global _pyotp_module
+    if _pyotp_module is None:
+        try:
+            import pyotp
+            _pyotp_module = pyotp
+        except Exception:
+            _pyotp_module = False
+    return _pyotp_module or None
 
 
 import logging, sys, asyncio
@@ -83,6 +102,7 @@ official_results_collection = None
 official_heats_collection = None
 user_settings_collection = None
 sessions_collection = None
+jobs_collection = None
 
 
 # FastAPI app setup
@@ -96,7 +116,10 @@ app.add_middleware(
     allow_credentials=True,   # kräver att allow_origins INTE är "*"
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Mongo-Queries"],
 )
+# Yttersta lagret: mäter hela requesten inkl. CORS och felhantering
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Security scheme
 security = HTTPBearer()
@@ -106,16 +129,6 @@ security = HTTPBearer()
 # Helper and utility functions
 ###########################
 
-def hash_password(password: str) -> str:
-    """Hash a plaintext password using bcrypt."""
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
-
-
-def verify_password(password: str, hashed: str) -> bool:
-    """Verify a plaintext password against a bcrypt hash."""
-    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
-
-
 def create_jwt_token(user_id: str, jti: str) -> str:
     """Create a JWT bound to a session-id (jti)."""
     payload = {
@@ -142,8 +155,14 @@ async def verify_jwt_token(
         jti = payload.get("jti")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        # Kräver giltig sessions-rad med samma jti
-        sess = await sessions_collection.find_one({"user_id": user_id, "id": jti}) if jti else None
+        # Kräver giltig sessions-rad med samma jti (cachas kort per (user_id, jti))
+        sess = session_cache.get(user_id, jti) if jti else None
+        if sess is None and jti:
+            sess = await sessions_collection.find_one(
+                {"user_id": user_id, "id": jti}, {"_id": 1, "fingerprint": 1}
+            )
+            if sess:
+                session_cache.put(user_id, jti, sess)
         if not sess:
             raise HTTPException(status_code=401, detail="Sessionen är utloggad eller ogiltig")
         # (valfritt) matcha fingerprint för att förhindra token-reuse från annan enhet
@@ -155,8 +174,8 @@ async def verify_jwt_token(
             raise
         except Exception:
             pass
-        # bump last_active
-        await sessions_collection.update_one({"_id": sess["_id"]}, {"$set": {"last_active": datetime.utcnow()}})
+        # bump last_active (write-behind, flushas i batch av session_cache)
+        session_cache.touch(sess["_id"])
         return user_id
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
@@ -185,19 +204,6 @@ def decode_2fa_ticket(token: str) -> Dict[str, Any]:
 
 
     
-def build_match_key(home_team_id: str, away_team_id: str, dt: datetime) -> str:
-    """
-    Normaliserar till ett dags-nyckel i UTC: YYYY-MM-DD|home|away
-    Använder bara datum (inte klockslag) så att samma match samma dag
-    inte kan skapas dubbelt av samma användare.
-    """
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc)
-    day = dt.astimezone(timezone.utc).strftime("%Y-%m-%d")
-    return f"{day}|{home_team_id}|{away_team_id}"
-
-
-
 def get_team_colors(team_position: str) -> List[str]:
     """
     Return standardized team colors.
@@ -211,113 +217,15 @@ def get_team_colors(team_position: str) -> List[str]:
     
     
     # --- Team name resolver ------------------------------------------------------
-CITY_SUFFIXES = {
-    "målilla","malilla","hallstavik","motala","gislaved",
-    "eskilstuna","norrköping","norrkoping","kumla","västervik","vastervik"
-}
-
-TEAM_ALIASES = {
-    # normaliserade strängar -> kanoniskt teamnamn (normaliserat)
-    "dackarna målilla": "dackarna",
-    "dackarna malilla": "dackarna",
-    "rospiggarna hallstavik": "rospiggarna",
-    "piraterna motala": "piraterna",
-    "lejonen gislaved": "lejonen",
-    "smederna eskilstuna": "smederna",
-    "vargarna norrköping": "vargarna",
-    "vargarna norrkoping": "vargarna",
-    "västervik västervik": "västervik",
-    "vastervik vastervik": "västervik",
-    # vanliga varianter
-    "dackarna": "dackarna",
-    "lejonen": "lejonen",
-    "piraterna": "piraterna",
-    "rospiggarna": "rospiggarna",
-    "smederna": "smederna",
-    "vargarna": "vargarna",
-    "västervik": "västervik",
-    "vastervik": "västervik",
-    "indianerna": "indianerna",
-}
-
-def _norm(s: str) -> str:
-    return (
-        (s or "").lower()
-        .encode("utf-8", "ignore")
-        .decode("utf-8")
-        .replace("å","a").replace("ä","a").replace("ö","o")
-        .split()
-    )
-
-def _normalize_join(s: str) -> str:
-    return " ".join(_norm(s))
-
-def _strip_city_suffix(name: str) -> str:
-    toks = _norm(name)
-    if toks and toks[-1] in CITY_SUFFIXES:
-        toks = toks[:-1]
-    return " ".join(toks)
-
-async def _build_team_index() -> dict:
-    """
-    Returnerar { normalized_name: team_doc } där normalized_name är både
-    'namn' och 'namn+stad' varianter.
-    """
-    idx = {}
-    async for t in teams_collection.find({}, {"_id":0}):
-        base = _normalize_join(t["name"])
-        idx[base] = t
-        if t.get("city"):
-            combo = _normalize_join(f"{t['name']} {t['city']}")
-            idx[combo] = t
-    return idx
-
-def _simple_similarity(a: str, b: str) -> float:
-    A, B = set(_norm(a)), set(_norm(b))
-    if not A or not B: return 0.0
-    inter = len(A & B)
-    union = len(A | B)
-    return inter / union
+# Normalisering, alias och index ligger i services/team_resolver.py
 
 async def resolve_team_name(scraped_name: str) -> dict | None:
     """
     Försöker matcha scraped_name mot teams i DB.
     Returnerar team-doc vid träff, annars None.
     """
-    idx = await _build_team_index()
-
-    n = _normalize_join(scraped_name)
-    if n in idx:  # exakt normaliserad träff
-        return idx[n]
-
-    # alias
-    if n in TEAM_ALIASES and TEAM_ALIASES[n] in idx:
-        return idx[TEAM_ALIASES[n]]
-
-    # ta bort stadssuffix
-    stripped = _strip_city_suffix(scraped_name)
-    if stripped in idx: 
-        return idx[stripped]
-    if stripped in TEAM_ALIASES and TEAM_ALIASES[stripped] in idx:
-        return idx[TEAM_ALIASES[stripped]]
-
-    # prova första ordet (t.ex. "Dackarna Malilla" -> "dackarna")
-    first = (n.split(" ")[0] if n else "")
-    if first in idx: 
-        return idx[first]
-    if first in TEAM_ALIASES and TEAM_ALIASES[first] in idx:
-        return idx[TEAM_ALIASES[first]]
-
-    # enkel fuzzy som sista steg
-    best_key, best_score = None, 0.0
-    for key in idx.keys():
-        sc = _simple_similarity(n, key)
-        if sc > best_score:
-            best_key, best_score = key, sc
-    if best_key and best_score >= 0.6:
-        return idx[best_key]
-
-    return None
+    await team_resolver.ensure(teams_collection)
+    return team_resolver.resolve(scraped_name)
 
     
 async def get_owned_match_or_403(matches_collection, match_id: str, user_id: str):
@@ -416,40 +324,19 @@ async def get_team_roster(team_id: str) -> Dict[str, List[Dict[str, Any]]]:
     Returnerar {"mains":[...], "reserves":[...]} för angivet lag.
     Varje rider: {id, name, lineup_no, is_reserve}
     lineup_no hämtas från fältet "number" om det finns, annars faller vi tillbaka.
+    Hämtas från roster_cache – listorna delas och ska inte muteras.
     """
-    riders = await riders_collection.find({"team_id": team_id}, {"_id": 0}).to_list(length=None)
-    mains: List[Dict[str, Any]] = []
-    reserves: List[Dict[str, Any]] = []
-    for r in riders:
-        lineup_no = r.get("lineup_no") or r.get("number") or None
-        item = {
-            "id": str(r["id"]),
-            "name": r.get("name", ""),
-            "lineup_no": int(lineup_no) if lineup_no is not None else None,
-            "is_reserve": bool(r.get("is_reserve", False)),
-        }
-        (reserves if item["is_reserve"] else mains).append(item)
-
-    # sortera på lineup_no om möjligt
-    mains.sort(key=lambda x: (x["lineup_no"] is None, x["lineup_no"]))
-    reserves.sort(key=lambda x: (x["lineup_no"] is None, x["lineup_no"]))
-
-    return {"mains": mains, "reserves": reserves}
+    entry = await roster_cache.get(team_id, riders_collection)
+    return entry.split()
 
 
+async def _match_riders_map(match: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """{rider_id: rider_doc} för båda lagen i matchen (från roster_cache)."""
+    home = await roster_cache.get(match["home_team_id"], riders_collection)
+    away = await roster_cache.get(match["away_team_id"], riders_collection)
+    return {**home.by_id, **away.by_id}
 
 
-#TSM MED GET_TEAM_ROSTER KODEN
-
-def _pick_rider_by_lineup(roster: Dict[str, List[Dict[str, Any]]], num: int) -> Dict[str, Any]:
-    if 1 <= num <= 5:
-        xs = [r for r in roster["mains"] if int(r.get("lineup_no") or 0) == num]
-        if xs: return xs[0]
-    elif num in (6, 7):
-        xs = [r for r in roster["reserves"] if int(r.get("lineup_no") or 0) == num]
-        if xs: return xs[0]
-    raise HTTPException(status_code=400, detail=f"Saknar förare med lineup_no {num}")
-
 
 
 def _first_available(restrict_to: List[str], used: set) -> str | None:
@@ -672,6 +559,10 @@ async def seed_teams_and_riders() -> Dict[str, int]:
         res = await riders_collection.insert_many(riders_to_insert)
         inserted_riders = len(res.inserted_ids)
 
+    # trupper kan ha ändrats – släpp cachade rosters och lagindex
+    roster_cache.invalidate()
+    team_resolver.invalidate()
+
     return {"created_teams": created_teams, "inserted_riders": inserted_riders}
 
 
@@ -744,6 +635,20 @@ async def generate_default_heats(home_team_id: str, away_team_id: str) -> List[D
 
 
 
+def _lineup_slots(roster: Dict[str, List[Dict[str, Any]]], size: int) -> List[Optional[Dict[str, Any]]]:
+    """
+    lineup_no -> rider som en direkt indexerbar lista (index 0 oanvänd).
+    Ordinarie fyller 1–5 och reserver 6–7; första träffen vinner.
+    """
+    slots: List[Optional[Dict[str, Any]]] = [None] * (size + 1)
+    for key, lo, hi in (("mains", 1, 5), ("reserves", 6, 7)):
+        for r in roster[key]:
+            num = int(r.get("lineup_no") or 0)
+            if lo <= num <= hi and num <= size and slots[num] is None:
+                slots[num] = r
+    return slots
+
+
 async def generate_match_heats(home_team_id: str, away_team_id: str, rules: Dict[str, Any]) -> List[Dict[str, Any]]:
     home = await get_team_roster(home_team_id)
     away = await get_team_roster(away_team_id)
@@ -751,31 +656,19 @@ async def generate_match_heats(home_team_id: str, away_team_id: str, rules: Dict
     if len(home["mains"]) < 5 or len(away["mains"]) < 5:
         raise HTTPException(status_code=400, detail="Varje lag måste ha minst 5 ordinarie förare registrerade.")
 
-    heats: List[Dict[str, Any]] = []
+    try:
+        schedule = get_schedule((rules or {}).get("schedule"))
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    def parse(cell: str, gate: str) -> Dict[str, Any]:
-        """
-        cell:
-          - t.ex. "R5" / "B3" / "G6" / "V7"  -> ordinarie/reserv enligt lineup_no
-          - t.ex. "V/R" eller "B/G"         -> nominering i heat 14–15 (väljs senare)
-        """
-        if "/" not in cell:
-            color = cell[0]  # R/B/G/V
-            num = int(cell[1:])
-            team_key = COLOR_TO_TEAM[color]  # "home" för R/B, "away" för G/V
-            rider = _pick_rider_by_lineup(home if team_key == "home" else away, num)
-            return {
-                "rider_id": str(rider["id"]),
-                "name": rider["name"],
-                "team": team_key,
-                "helmet_color": COLOR_TO_HELMET[color],
-                "lineup_no": num,
-                "is_reserve": bool(rider.get("is_reserve", num in (6, 7))),
-                "locked": bool(num in (6, 7)),  # reservernas schemalagda heat är låsta
-            }
-        else:
+    lineup = {
+        "home": _lineup_slots(home, schedule.max_lineup_no),
+        "away": _lineup_slots(away, schedule.max_lineup_no),
+    }
+
+    def build(slot) -> Dict[str, Any]:
+        if slot.nomination:
             # Nominering (14–15): inga fasta förare ännu
-            c1, c2 = cell.split("/")
             return {
                 "rider_id": None,
                 "name": None,
@@ -784,19 +677,27 @@ async def generate_match_heats(home_team_id: str, away_team_id: str, rules: Dict
                 "lineup_no": None,
                 "is_reserve": False,
                 "locked": False,
-                "color_choices": [c1, c2],    # t.ex. ["V","R"] eller ["G","B"]
+                "color_choices": list(slot.color_choices),  # t.ex. ["V","R"] eller ["G","B"]
             }
-
-    for heat_no, g1, g2, g3, g4 in ELITSERIEN_2_15_7:
-        riders = {
-            "1": parse(g1, "1"),
-            "2": parse(g2, "2"),
-            "3": parse(g3, "3"),
-            "4": parse(g4, "4"),
+        num = slot.lineup_no
+        rider = lineup[slot.team][num]
+        if rider is None:
+            raise HTTPException(status_code=400, detail=f"Saknar förare med lineup_no {num}")
+        return {
+            "rider_id": str(rider["id"]),
+            "name": rider["name"],
+            "team": slot.team,
+            "helmet_color": slot.helmet_color,
+            "lineup_no": num,
+            "is_reserve": bool(rider.get("is_reserve", num in (6, 7))),
+            "locked": bool(num in (6, 7)),  # reservernas schemalagda heat är låsta
         }
+
+    heats: List[Dict[str, Any]] = []
+    for heat_no, gates in schedule.heats:
         heats.append({
             "heat_number": heat_no,
-            "riders": riders,
+            "riders": {str(g): build(slot) for g, slot in enumerate(gates, start=1)},
             "results": [],
             "status": "upcoming",
         })
@@ -804,6 +705,32 @@ async def generate_match_heats(home_team_id: str, away_team_id: str, rules: Dict
     return heats
 
 
+def _rules_for_schedule(name: Optional[str]) -> Dict[str, Any]:
+    """meta.rules för en ny match; `name` väljer ett registrerat heatschema."""
+    if not name:
+        return DEFAULT_RULES
+    if name not in SCHEDULES:
+        raise HTTPException(status_code=400, detail=f"Okänt heatschema: {name}")
+    return {**DEFAULT_RULES, "schedule": name}
+
+
+def _match_schedule(match: Dict[str, Any]) -> CompiledSchedule:
+    rules = (match.get("meta") or {}).get("rules") or {}
+    try:
+        return get_schedule(rules.get("schedule"))
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/schedules")
+async def list_schedules() -> List[Dict[str, Any]]:
+    """Registrerade heatschemas som kan väljas med `schedule` när en match skapas."""
+    return [
+        {"name": s.name, "heats": len(s.heats), "nomination_heats": list(s.nomination_heats)}
+        for s in SCHEDULES.values()
+    ]
+
+
 
 
 
@@ -840,7 +767,8 @@ class ResolveTeamIn(BaseModel):
     name: str
     
 class CreateFromOfficialIn(BaseModel):
-    official_match_id: str   
+    official_match_id: str
+    schedule: Optional[str] = None  # namn i helpers.schedule_elit.SCHEDULES
 
 
 ###########################
@@ -863,14 +791,14 @@ async def startup_event() -> None:
     global users_collection, teams_collection, matches_collection
     global riders_collection, user_matches_collection
     global official_matches_collection, official_results_collection, official_heats_collection
-    global user_settings_collection, sessions_collection
+    global user_settings_collection, sessions_collection, jobs_collection
 
     mongo_url = os.getenv("MONGO_URL")  # Example: mongodb+srv://user:pw@cluster.mongodb.net/
 
     # Important parameters added here:
     # client = AsyncIOMotorClient(mongo_url, tls=True)
     # NÄR JAG KÖR LOKALT:
-    client = AsyncIOMotorClient(mongo_url)
+    client = AsyncIOMotorClient(mongo_url, event_listeners=[metrics.command_listener])
 
     db = client["speedway_elitserien"]
 
@@ -884,80 +812,44 @@ async def startup_event() -> None:
     official_heats_collection = db["official_heats"]
     user_settings_collection = db["user_settings"]
     sessions_collection = db["sessions"]
+    jobs_collection = db["jobs"]
     
-    try:
-        await user_settings_collection.create_index("user_id", unique=True, name="uniq_user_settings")
-    except Exception as e:
-        print(f"[WARN] user_settings index: {e}")
     # try:
     #     await sessions_collection.create_index([("user_id", 1), ("last_active", -1)], name="sessions_user_time")
     # except Exception as e:
     #     print(f"[WARN] sessions index: {e}")
     
-    #TESTAR NYTT FÖR UPD SESSION HANTERING 
-    # Sessions-index: unikt per (user_id,fingerprint) så samma enhet inte dupliceras
+    # Datamigreringar (sessions-dedupe, username_cf, match_key) är versionerade i
+    # services/migrations.py: en find_one när schemat är aktuellt, annars kör
+    # en worker dem under lås medan övriga startar direkt.
     try:
-        # Rensa ev. dubbletter innan vi sätter unique-index
-        docs = await sessions_collection.find(
-            {}, projection={"_id": 1, "user_id": 1, "fingerprint": 1, "last_active": 1}
-        ).sort([("user_id", 1), ("fingerprint", 1), ("last_active", -1)]).to_list(length=None)
-        seen = set()
-        for s in docs:
-            key = (s.get("user_id"), s.get("fingerprint"))
-            if key in seen:
-                await sessions_collection.delete_one({"_id": s["_id"]})
-            else:
-                seen.add(key)
-        await sessions_collection.create_index(
-            [("user_id", 1), ("fingerprint", 1)],
-            unique=True,
-            name="uniq_session_fp",
-        )
-        # (valfritt) TTL 30 dagar på last_active för att städa bort inaktiva sessioner
-        try:
-            await sessions_collection.create_index(
-                "last_active",
-                expireAfterSeconds=60 * 60 * 24 * 30,
-                name="ttl_last_active_30d",
-            )
-        except Exception as e:
-            print(f"[WARN] sessions TTL index: {e}")
+        await run_migrations(db)
     except Exception as e:
-        print(f"[WARN] sessions unique index: {e}")
-    
-    
-    
-     # --- BACKFILL username_cf + index (körs vid uppstart) ---  # NEW
-    # Fyll username_cf där det saknas (Mongo saknar "casefold", så vi använder $toLower här).
-    # Detta täcker 99% av fallen; nyinläggningar använder Python casefold() i register/login.
-    await users_collection.update_many(
-        {"username_cf": {"$exists": False}},
-        [ {"$set": {"username_cf": {"$toLower": "$username"}}} ]
-    )
-    # Försök skapa unikt index (race-safe). Misslyckas om det redan finns dubletter.
-    try:
-        await users_collection.create_index(
-            "username_cf",
-            unique=True,
-            name="uniq_username_cf"
-        )
-    except OperationFailure as e:
-        # Logga och låt servern starta; åtgärda dubletter separat.
-        print(f"[WARN] unique index on username_cf not created: {e}")
-    
-    # Unikt index för att hindra dubletter per användare och match_key
-# (partial -> påverkar endast dokument som har "match_key")
-    await matches_collection.create_index(
-        [("created_by", 1), ("match_key", 1)],
-        unique=True,
-        name="uniq_user_match_key",
-        partialFilterExpression={"match_key": {"$exists": True, "$type": "string"}},
-    )
+        print(f"[WARN] migrations: {e}")
+
+    # Alla index deklareras i services/indexes.py. Skapas efter migreringarna
+    # ovan så att unika index går igenom; misslyckade loggas och servern startar ändå.
+    index_result = await apply_indexes(db)
+    if index_result["created"]:
+        print(f"[INFO] skapade index: {', '.join(index_result['created'])}")
+
+    # last_active skrivs i batchar i stället för en gång per request
+    session_cache.start(lambda: sessions_collection)
+
+    # admin-jobb: jobb vars process dog läggs tillbaka i kön, köade lokala jobb startas
+    await job_runner.init(jobs_collection)
 
-    
     # await seed_teams_and_riders()  KÖRA I EGEN ENDPOINT /API/SEED?
-    
-    
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    """Requeue running jobs, flush pending session activity and stop the password pool."""
+    await job_runner.stop()
+    await session_cache.stop(sessions_collection)
+    passwords.shutdown()
+
+
 @app.post("/api/seed")
 async def run_seed():
     await seed_teams_and_riders()
@@ -1042,7 +934,7 @@ async def register(user_data: UserRegister, request: Request) -> Dict[str, Any]:
     if existing:
         raise HTTPException(status_code=400, detail="Användare finns redan")
     user_id = str(uuid.uuid4())
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await hash_password_async(user_data.password)
     user_doc = {
         "id": user_id,
         "username": user_data.username,
@@ -1059,6 +951,7 @@ async def register(user_data: UserRegister, request: Request) -> Dict[str, Any]:
     if existing:
         jti = existing["id"]
         await sessions_collection.update_one({"_id": existing["_id"]}, {"$set": {"last_active": now, "device_label": device_label}})
+        session_cache.mark_written(existing["_id"])
     else:
         # max 3 enheter
         active_count = await sessions_collection.count_documents({"user_id": user_id})
@@ -1211,9 +1104,20 @@ async def login(user_data: UserLogin, request: Request) -> Dict[str, Any]:
     """
     norm = normalize_username(user_data.username)
     user = await users_collection.find_one({"username_cf": norm})
-    if not user or not verify_password(user_data.password, user["password"]):
+    if not user or not await verify_password_async(user_data.password, user["password"]):
         raise HTTPException(status_code=401, detail="Felaktiga inloggningsuppgifter")
 
+    # Transparent rehash om lagrad bcrypt-cost skiljer sig från konfigurerad
+    if needs_rehash(user["password"]):
+        try:
+            rehashed = await hash_password_async(user_data.password)
+            await users_collection.update_one(
+                {"id": user["id"], "password": user["password"]},
+                {"$set": {"password": rehashed}},
+            )
+        except HTTPException:
+            pass  # överbelastad pool – försök igen vid nästa inloggning
+
     device_label, fp = _device_label_and_fp(request)
     ip = request.headers.get("x-forwarded-for") or (request.client.host if request.client else "")
     now = datetime.utcnow()
@@ -1239,6 +1143,7 @@ async def login(user_data: UserLogin, request: Request) -> Dict[str, Any]:
             {"_id": existing["_id"]},
             {"$set": {"last_active": now, "ip": ip, "device_label": device_label}}
         )
+        session_cache.mark_written(existing["_id"])
     else:
         # Max 3 enheter per användare
         active_count = await sessions_collection.count_documents({"user_id": user["id"]})
@@ -1265,6 +1170,7 @@ async def login(user_data: UserLogin, request: Request) -> Dict[str, Any]:
 
 @app.post("/api/auth/2fa/verify")
 async def verify_2fa_login(body: TwoFALoginVerify, request: Request) -> Dict[str, Any]:
+    pyotp = _pyotp()
     if not pyotp:
         raise HTTPException(status_code=500, detail="2FA kräver pyotp på servern")
 
@@ -1291,6 +1197,7 @@ async def verify_2fa_login(body: TwoFALoginVerify, request: Request) -> Dict[str
             {"_id": existing["_id"]},
             {"$set": {"last_active": now, "ip": ip, "device_label": device_label}}
         )
+        session_cache.mark_written(existing["_id"])
     else:
         active_count = await sessions_collection.count_documents({"user_id": user_id})
         if active_count >= 3:
@@ -1349,8 +1256,7 @@ async def get_team_riders(team_id: str) -> Dict[str, Any]:
     Returnerar truppen uppdelad i mains(1–5) och reserves(6–7).
     Varje rider har: id, name, team_id, lineup_no, is_reserve.
     """
-    cur = riders_collection.find({"team_id": team_id}, {"_id": 0})
-    xs = await cur.to_list(length=None)
+    xs = list((await roster_cache.get(team_id, riders_collection)).by_id.values())
 
     def to_item(r):
         # finns både "number" och ev. "lineup_no" i din DB – normalisera:
@@ -1396,19 +1302,50 @@ async def get_all_riders() -> List[Dict[str, Any]]:
 ###########################
 
 @app.get("/api/matches")
-async def get_matches() -> List[Dict[str, Any]]:
+async def get_matches(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+) -> List[Dict[str, Any]]:
     """
-    Return all matches with human‑friendly team names and optional official_match_id.
+    Return matches with human‑friendly team names and optional official_match_id.
+
+    Team names are joined in the same aggregation ($lookup) and the embedded
+    `heats` array is left out; `has_results` tells the list view whether a
+    protocol has been started. With `limit`, results are paged by `_id` and
+    the cursor for the next page is returned in the `X-Next-Cursor` header.
     """
-    matches_cursor = matches_collection.find({}, {"_id": 0})
-    matches = await matches_cursor.to_list(length=None)
-    # Enrich with team names
+    query: Dict[str, Any] = {}
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Ogiltig cursor")
+        query["_id"] = {"$gt": ObjectId(cursor)}
+
+    pipeline: List[Dict[str, Any]] = [{"$match": query}, {"$sort": {"_id": 1}}]
+    if limit:
+        pipeline.append({"$limit": limit + 1})
+    pipeline += [
+        {"$lookup": {"from": "teams", "localField": "home_team_id", "foreignField": "id", "as": "_home"}},
+        {"$lookup": {"from": "teams", "localField": "away_team_id", "foreignField": "id", "as": "_away"}},
+        {"$addFields": {
+            "home_team": {"$ifNull": [{"$arrayElemAt": ["$_home.name", 0]}, "Okänt lag"]},
+            "away_team": {"$ifNull": [{"$arrayElemAt": ["$_away.name", 0]}, "Okänt lag"]},
+            "official_match_id": {"$ifNull": ["$official_match_id", None]},
+            "has_results": {"$anyElementTrue": [{"$map": {
+                "input": {"$ifNull": ["$heats", []]},
+                "as": "h",
+                "in": {"$gt": [{"$size": {"$ifNull": ["$$h.results", []]}}, 0]},
+            }}]},
+        }},
+        {"$project": {"heats": 0, "_home": 0, "_away": 0}},
+    ]
+    matches = await matches_collection.aggregate(pipeline).to_list(length=None)
+
+    if limit and len(matches) > limit:
+        matches = matches[:limit]
+        response.headers["X-Next-Cursor"] = str(matches[-1]["_id"])
     for match in matches:
-        home_team = await teams_collection.find_one({"id": match["home_team_id"]})
-        away_team = await teams_collection.find_one({"id": match["away_team_id"]})
-        match["home_team"] = home_team["name"] if home_team else "Okänt lag"
-        match["away_team"] = away_team["name"] if away_team else "Okänt lag"
-        match.setdefault("official_match_id", None)
+        match.pop("_id", None)
     return matches
 
 
@@ -1472,11 +1409,12 @@ async def create_match(match_data: Dict[str, Any], user_id: str = Depends(verify
     if existing:
         raise HTTPException(status_code=409, detail="Du har redan ett protokoll för denna match.")
 
-    # 4) Generera heats
+    # 4) Generera heats enligt valt schema (default elitserien_2_15_7)
+    rules = _rules_for_schedule(match_data.get("schedule"))
     heats = await generate_match_heats(
         match_data["home_team_id"],
         match_data["away_team_id"],
-        DEFAULT_RULES,
+        rules,
     )
 
     match_id = str(uuid.uuid4())
@@ -1492,8 +1430,10 @@ async def create_match(match_data: Dict[str, Any], user_id: str = Depends(verify
         "created_by": user_id,
         "created_at": datetime.utcnow(),
         "official_match_id": match_data.get("official_match_id"),
-        "meta": {"rules": DEFAULT_RULES},
+        "meta": {"rules": rules},
         "match_key": match_key,  # <-- NYTT
+        "version": 0,
+        "ride_counts": _current_heat_counts({"heats": heats}),
     }
 
     try:
@@ -1521,6 +1461,8 @@ async def get_match(match_id: str, user_id: str = Depends(verify_jwt_token)):
     # säkerhetsbälte: ta bort _id om det ändå skulle slinka med
     match.pop("_id", None)
     match.setdefault("meta", {}).setdefault("rules", DEFAULT_RULES)
+    # klienten skickar tillbaka den som If-Match vid heat-/nomineringsskrivningar
+    match["version"] = _match_version(match)
     return match
 
 
@@ -1567,6 +1509,55 @@ async def delete_user_match(
     return {"ok": True}
 
 
+# ---------------------------------------------------------------------------
+# Atomära heat-uppdateringar + optimistisk låsning
+# ---------------------------------------------------------------------------
+# Varje skrivning rör bara heats.$[h] via arrayFilters och räknar upp
+# match.version. GET /api/matches/{id} returnerar `version`; protokollsidan
+# skickar den som `If-Match` på heat-, förar- och nomineringsanropen och tar
+# det nya värdet från svaret. En flik som sparar från en gammal laddning får
+# därmed 409 i stället för att skriva över en annan fliks ändring.
+# Versionsfiltret i update_one fångar dessutom skrivningar som krockar mellan
+# find_one och update_one i samma request. Anrop utan If-Match (äldre klienter)
+# skyddas bara av det senare.
+
+def _match_version(match: Dict[str, Any]) -> int:
+    return int(match.get("version") or 0)
+
+
+def _check_if_match(request: Optional[Request], match: Dict[str, Any]) -> None:
+    """Honour an optional `If-Match: <version>` header from the client."""
+    raw = request.headers.get("if-match") if request else None
+    if raw is None:
+        return
+    try:
+        expected = int(raw.strip().strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Ogiltig If-Match-header")
+    if expected != _match_version(match):
+        raise HTTPException(status_code=409, detail="Protokollet har ändrats i en annan flik – ladda om")
+
+
+async def _update_match_versioned(
+    match: Dict[str, Any],
+    update: Dict[str, Any],
+    array_filters: Optional[List[Dict[str, Any]]] = None,
+) -> int:
+    """
+    Apply `update` only if the match still has the version we read.
+    Returns the new version, raises 409 on a concurrent write.
+    """
+    version = _match_version(match)
+    query: Dict[str, Any] = {"id": match["id"]}
+    # äldre dokument saknar fältet helt
+    query["version"] = version if version else {"$in": [0, None]}
+    update.setdefault("$inc", {})["version"] = 1
+    res = await matches_collection.update_one(query, update, array_filters=array_filters)
+    if res.matched_count == 0:
+        raise HTTPException(status_code=409, detail="Protokollet har ändrats i en annan flik – ladda om")
+    return version + 1
+
+
 # UPDATEAD GÄLLER
 
 @app.put("/api/matches/{match_id}/heat/{heat_number}/riders")
@@ -1574,6 +1565,7 @@ async def update_heat_riders(
     match_id: str,
     heat_number: int,
     rider_assignments: Dict[str, str],
+    request: Request,
     user_id: str = Depends(verify_jwt_token),
 ) -> Dict[str, Any]:
     match = await matches_collection.find_one({"id": match_id})
@@ -1581,24 +1573,27 @@ async def update_heat_riders(
         raise HTTPException(status_code=404, detail="Match hittades inte")
     if match.get("created_by") != user_id:
         raise HTTPException(status_code=403, detail="Inte behörig")
-
-    # validera enligt reglerna (TR, lås, lag, limits)
-    await validate_heat_rider_change(match, heat_number, rider_assignments)
+    _check_if_match(request, match)
 
     # hitta heat
-    heats = match["heats"]
-    for i, h in enumerate(heats):
-        if h.get("heat_number") == heat_number:
-            current_heat = h
-            break
-    else:
+    current_heat = next((h for h in match["heats"] if h.get("heat_number") == heat_number), None)
+    if current_heat is None:
         raise HTTPException(status_code=404, detail="Heat hittades inte")
+    for gate in rider_assignments:
+        if gate not in ("1", "2", "3", "4") or gate not in current_heat.get("riders", {}):
+            raise HTTPException(status_code=400, detail=f"Ogiltig gate: {gate}")
+
+    # validera enligt reglerna (TR, lås, lag, limits)
+    await validate_heat_rider_change(match, heat_number, rider_assignments)
 
     # skriv byten – färger enligt gate
+    riders_by_id = await _match_riders_map(match)
+    old_riders = dict(current_heat["riders"])
+    updates: Dict[str, Any] = {}
     for gate, new_rider_id in rider_assignments.items():
         gate_int = int(gate)
         expected_team = "home" if gate_int in (1, 3) else "away"
-        rider = await riders_collection.find_one({"id": new_rider_id})
+        rider = riders_by_id[str(new_rider_id)]
         colors = get_team_colors(expected_team)
         color_index = 0 if gate_int in (1, 2) else 1
         current_heat["riders"][gate] = {
@@ -1607,125 +1602,77 @@ async def update_heat_riders(
             "team": expected_team,
             "helmet_color": colors[color_index],
         }
+        updates[f"heats.$[h].riders.{gate}"] = current_heat["riders"][gate]
 
-    heats[i] = current_heat
-    await matches_collection.update_one({"id": match_id}, {"$set": {"heats": heats}})
-    return {"message": "Heat-uppställning uppdaterad", "heat": current_heat}
+    version = _match_version(match)
+    if updates:
+        update: Dict[str, Any] = {"$set": updates}
+        _ride_counts_update(match, _ride_count_delta(old_riders, current_heat["riders"]), update)
+        version = await _update_match_versioned(match, update, [{"h.heat_number": heat_number}])
+    return {"message": "Heat-uppställning uppdaterad", "heat": current_heat, "version": version}
 
 
 
 @app.put("/api/matches/{match_id}/heat/{heat_number}/result")
-async def update_heat_result(match_id: str, heat_number: int, result_data: Dict[str, Any], user_id: str = Depends(verify_jwt_token)) -> Dict[str, Any]:
+async def update_heat_result(match_id: str, heat_number: int, result_data: Dict[str, Any], request: Request, user_id: str = Depends(verify_jwt_token)) -> Dict[str, Any]:
     """
     Update the result of a single heat within a match. Calculates points
     for each rider according to Swedish Elitserien rules (3‑2‑1‑0 per heat) and
     assigns bonus points for riders finishing second in a 5‑1 heat or third
     in a 3‑3 heat. Bonus points are stored per rider but do not contribute
     to the team totals. The deprecated joker logic is ignored.
+
+    The heat's team contribution is stored on the heat itself, so saving a
+    corrected result only adjusts the match totals by the difference.
     """
     match = await matches_collection.find_one({"id": match_id})
     if not match:
         raise HTTPException(status_code=404, detail="Match hittades inte")
+    _check_if_match(request, match)
 
-    # if not match:
-    #     raise HTTPException(status_code=404, detail="Match hittades inte")
     # Locate the heat to update
-    heat_index = None
-    for i, heat in enumerate(match["heats"]):
-        if heat["heat_number"] == heat_number:
-            heat_index = i
-            break
-    if heat_index is None:
+    heat = next((h for h in match["heats"] if h.get("heat_number") == heat_number), None)
+    if heat is None:
         raise HTTPException(status_code=404, detail="Heat hittades inte")
-    # Points mapping (standard 3‑2‑1‑0)
-    points_map = {1: 3, 2: 2, 3: 1, 4: 0}
-    updated_results: List[Dict[str, Any]] = []
-    home_points = 0
-    away_points = 0
-    # Map rider_id to its team for quick lookup
-    rider_team_map: Dict[str, str] = {}
-    for gate, rider_info in match["heats"][heat_index]["riders"].items():
-        rider_team_map[rider_info["rider_id"]] = rider_info["team"]
-    # Process each result entry
-    for result in result_data.get("results", []):
-        pts = 0
-        pos = result.get("position", 0)
-        status = result.get("status", "completed")
-        if status == "completed":
-            pts = points_map.get(pos, 0)
-        elif status == "excluded":
-            pts = 0
-        updated_results.append({
-            "rider_id": result["rider_id"],
-            "position": pos,
-            "points": pts,
-            "status": status,
-            # bonus_points will be filled later
-        })
-        # Tally team points (bonus not included)
-        team = rider_team_map.get(result["rider_id"])
-        if team == "home":
-            home_points += pts
-        elif team == "away":
-            away_points += pts
-    # Assign bonus points based on heat result pattern
-    # Sort results by position ascending (1–4)
-    sorted_results = sorted(updated_results, key=lambda r: r.get("position", 0))
-    if len(sorted_results) == 4:
-        team_pos1 = rider_team_map.get(sorted_results[0]["rider_id"])
-        team_pos2 = rider_team_map.get(sorted_results[1]["rider_id"])
-        team_pos3 = rider_team_map.get(sorted_results[2]["rider_id"])
-        # Check for 5‑1 scenario: positions 1 and 2 from same team
-        if team_pos1 == team_pos2:
-            # Assign bonus to rider in 2nd position
-            sorted_results[1]["bonus_points"] = 1
-        # Check for 3‑3 scenario: positions 2 and 3 from same team
-        elif team_pos2 == team_pos3:
-            sorted_results[2]["bonus_points"] = 1
-    # Ensure bonus_points defaults to 0 for all riders
-    for res in updated_results:
-        res.setdefault("bonus_points", 0)
-    # Persist updated results and scores
-    match["heats"][heat_index]["results"] = updated_results
-    match["heats"][heat_index]["status"] = "completed"
+
+    updated_results, points = score_heat(heat, result_data.get("results", []))
+    home_points, away_points = points["home"], points["away"]
+
+    # Idempotent: applicera bara skillnaden mot vad heatet bidrog med tidigare
+    old_home, old_away = heat_points(heat)
+    update: Dict[str, Any] = {
+        "$set": {
+            "heats.$[h].results": updated_results,
+            "heats.$[h].status": "completed",
+            "heats.$[h].points": points,
+        },
+    }
+    if has_stored_points(match["heats"]):
+        update["$inc"] = {"home_score": home_points - old_home, "away_score": away_points - old_away}
+    else:
+        # äldre protokoll (dubbelräknade totals) – räkna om från alla heats och
+        # spara bidraget på varje gammalt heat, så att omräkningen bara sker en gång
+        heat["results"], heat["points"] = updated_results, points
+        for idx, legacy in missing_points(match["heats"]).items():
+            update["$set"][f"heats.{idx}.points"] = legacy
+        update["$set"]["home_score"], update["$set"]["away_score"] = match_totals(match["heats"])
+
+    # Persist updated results and scores – endast detta heat skrivs
     # Joker logic is ignored; do not update joker fields
-    match["home_score"] += home_points
-    match["away_score"] += away_points
-    await matches_collection.update_one(
-        {"id": match_id},
-        {"$set": {
-            "heats": match["heats"],
-            "home_score": match["home_score"],
-            "away_score": match["away_score"],
-        }}
-    )
+    version = await _update_match_versioned(match, update, [{"h.heat_number": heat_number}])
     return {
         "message": "Heat resultat uppdaterat",
         "home_points": home_points,
         "away_points": away_points,
         "heat_results": updated_results,
+        "version": version,
     }
-    
-    
-    
+
+
 def _team_scores_upto(match: Dict[str, Any], upto_heat: int) -> tuple[int,int]:
-    home = away = 0
-    for h in match["heats"]:
-        hn = h.get("heat_number")
-        if not isinstance(hn, int) or hn >= upto_heat:
-            continue
-        for res in h.get("results", []):
-            pts = int(res.get("points", 0))
-            rid = res.get("rider_id")
-            team = None
-            for e in h.get("riders", {}).values():
-                if e.get("rider_id") == rid:
-                    team = e.get("team")
-                    break
-            if team == "home": home += pts
-            elif team == "away": away += pts
-    return home, away    
-    
+    return team_scores_upto(match["heats"], upto_heat)
+
+
 # NYE NDPOITN /VALIDERING FÖR NOMINERINGAR TILL HEAT 14 OCH 15    
 # 3) Validering vid byten (PUT /heat/{n}/riders)
 # 
@@ -1749,10 +1696,16 @@ async def validate_heat_rider_change(
     # 1) Gates 1/3 = home, 2/4 = away + rätt lag för vald förare
     home_team_id = match["home_team_id"]
     away_team_id = match["away_team_id"]
+    riders_by_id = await _match_riders_map(match)
+    # förare utanför lagens truppen (felval) hämtas i en enda $in-fråga
+    unknown = list({str(r) for r in rider_assignments.values()} - riders_by_id.keys())
+    if unknown:
+        async for r in riders_collection.find({"id": {"$in": unknown}}, {"_id": 0}):
+            riders_by_id[str(r["id"])] = r
     for gate, new_rider_id in rider_assignments.items():
         gate_int = int(gate)
         expected_team = "home" if gate_int in (1, 3) else "away"
-        rider = await riders_collection.find_one({"id": new_rider_id})
+        rider = riders_by_id.get(str(new_rider_id))
         if not rider:
             raise HTTPException(status_code=404, detail=f"Förare {new_rider_id} hittades inte")
         if expected_team == "home" and rider.get("team_id") != home_team_id:
@@ -1793,27 +1746,18 @@ async def validate_heat_rider_change(
         raise HTTPException(status_code=400, detail=f"Max {t_max_per_heat} byte tillåtet per heat enligt TR")
 
     # 4) Ride-limits (enkelt tak: ordinarie max 6, reserv max 5)
-    rider_heat_counts: Dict[str, int] = {}
-    for h in heats:
-        for e in h.get("riders", {}).values():
-            rid = e.get("rider_id")
-            if rid:
-                rider_heat_counts[rid] = rider_heat_counts.get(rid, 0) + 1
-
-    # simulera byten
-    for gate, new_rider_id in rider_assignments.items():
-        old_rider_id = heat["riders"][gate]["rider_id"]
-        if old_rider_id != new_rider_id:
-            rider_heat_counts[old_rider_id] = max(0, rider_heat_counts.get(old_rider_id, 1) - 1)
-            rider_heat_counts[new_rider_id] = rider_heat_counts.get(new_rider_id, 0) + 1
-
-    for rid, cnt in rider_heat_counts.items():
-        rider = await riders_collection.find_one({"id": rid})
-        if not rider: 
+    # Bara förare vars antal ökar kan passera taket – kolla endast dem.
+    counts = _ride_counts(match)
+    new_riders = {gate: {"rider_id": rid} for gate, rid in rider_assignments.items()}
+    delta = _ride_count_delta(heat["riders"], {**heat["riders"], **new_riders})
+    for rid, d in delta.items():
+        if d <= 0:
             continue
-        is_reserve = bool(rider.get("is_reserve", False))
-        max_heats = 5 if is_reserve else 6
-        if cnt > max_heats:
+        rider = riders_by_id.get(str(rid))
+        if not rider:
+            continue
+        max_heats = _ride_limit_for(rider)
+        if counts.get(rid, 0) + d > max_heats:
             nm = rider.get("name", rid)
             raise HTTPException(status_code=400, detail=f"{nm} överskrider max antal heat ({max_heats})")
 
@@ -1838,8 +1782,8 @@ async def _fetch_team_riders_map(team_id: str) -> Dict[str, Dict[str, Any]]:
     """
     returnerar { rider_id: rider_doc }
     """
-    xs = await riders_collection.find({"team_id": team_id}, {"_id": 0}).to_list(length=None)
-    return { str(x["id"]): x for x in xs }
+    entry = await roster_cache.get(team_id, riders_collection)
+    return entry.by_id
 
 def _ride_limit_for(rider_doc: Dict[str, Any]) -> int:
     # enkel limit: ordinarie=6, reserv=5
@@ -1857,6 +1801,36 @@ def _current_heat_counts(match: Dict[str, Any]) -> Dict[str, int]:
                 counts[rid] = counts.get(rid, 0) + 1
     return counts
 
+def _ride_counts(match: Dict[str, Any]) -> Dict[str, int]:
+    """
+    match.ride_counts underhålls vid varje uppställningsändring; äldre
+    protokoll utan fältet räknas fram från heats.
+    """
+    stored = match.get("ride_counts")
+    return stored if isinstance(stored, dict) else _current_heat_counts(match)
+
+def _ride_count_delta(old_riders: Dict[str, Any], new_riders: Dict[str, Any]) -> Dict[str, int]:
+    """Ändring i antal uppsättningar per rider när ett heats riders byts ut."""
+    delta: Dict[str, int] = {}
+    for entries, sign in ((old_riders, -1), (new_riders, 1)):
+        for e in (entries or {}).values():
+            rid = (e or {}).get("rider_id")
+            if rid:
+                delta[rid] = delta.get(rid, 0) + sign
+    return {rid: d for rid, d in delta.items() if d}
+
+def _ride_counts_update(match: Dict[str, Any], delta: Dict[str, int], update: Dict[str, Any]) -> None:
+    """Lägg ride_counts-ändringen i ett update-dokument ($inc, eller $set för äldre protokoll)."""
+    if not delta:
+        return
+    if isinstance(match.get("ride_counts"), dict):
+        inc = update.setdefault("$inc", {})
+        for rid, d in delta.items():
+            inc[f"ride_counts.{rid}"] = d
+    else:
+        # heats i `match` är redan uppdaterade av anroparen
+        update.setdefault("$set", {})["ride_counts"] = _current_heat_counts(match)
+
 def _gate_order_for_team_in_heat(heat: Dict[str, Any], team: str) -> list[tuple[str, dict]]:
     """
     Returnerar [(gate, entry), ...] för de gates i detta heat som tillhör 'team'
@@ -1916,7 +1890,8 @@ def _assign_nomination_to_gates(heat: Dict[str, Any], team: str, rider_ids: list
 @app.put("/api/matches/{match_id}/nominations")
 async def update_nominations(
     match_id: str,
-    nominations: Dict[str, Dict[str, list[str]]],  # {heat14:{home:[],away:[]}, heat15:{home:[],away:[]}}
+    nominations: Dict[str, Dict[str, list[str]]],  # {"heat<N>": {home:[],away:[]}} per nomineringsheat
+    request: Request,
     user_id: str = Depends(verify_jwt_token),
 ) -> Dict[str, Any]:
     """
@@ -1925,6 +1900,7 @@ async def update_nominations(
       "heat14": { "home": ["h1","h2"], "away": ["a1","a2"] },
       "heat15": { "home": ["hTop1","hTop2"], "away": ["aTop1","aTop2"] }
     }
+    En nyckel per nomineringsheat i matchens schema (CompiledSchedule.nomination_heats).
     """
     match = await matches_collection.find_one({"id": match_id})
     if not match:
@@ -1933,18 +1909,24 @@ async def update_nominations(
     # Endast ägaren får uppdatera
     if match.get("created_by") != user_id:
         raise HTTPException(status_code=403, detail="Inte behörig")
-
-    # 1) Kontroll: 1–13 måste vara completed
-    completed = sum(1 for h in match["heats"] if h.get("status") == "completed")
-    if completed < 13:
-        raise HTTPException(status_code=400, detail="Nominering kan endast göras efter heat 13")
+    _check_if_match(request, match)
+
+    # 1) Kontroll: alla heat före nomineringsheaten (1–13) måste vara completed
+    schedule = _match_schedule(match)
+    nom_heats = schedule.nomination_heats
+    if not nom_heats:
+        raise HTTPException(status_code=400, detail="Heatschemat har inga nomineringsheat")
+    regular = [h for h in match["heats"] if h.get("heat_number") not in nom_heats]
+    if any(h.get("status") != "completed" for h in regular):
+        last = max((h.get("heat_number") or 0 for h in regular), default=0)
+        raise HTTPException(status_code=400, detail=f"Nominering kan endast göras efter heat {last}")
 
     home_id = match["home_team_id"]
     away_id = match["away_team_id"]
 
     # 2) Plocka riders per lag
-    home_riders_all = await riders_collection.find({"team_id": home_id}).to_list(length=None)
-    away_riders_all = await riders_collection.find({"team_id": away_id}).to_list(length=None)
+    home_riders_all = list((await roster_cache.get(home_id, riders_collection)).by_id.values())
+    away_riders_all = list((await roster_cache.get(away_id, riders_collection)).by_id.values())
     id_set_home = {r["id"] for r in home_riders_all}
     id_set_away = {r["id"] for r in away_riders_all}
 
@@ -1972,33 +1954,36 @@ async def update_nominations(
     home_top3 = top3_of_team(home_main_ids)
     away_top3 = top3_of_team(away_main_ids)
 
-    # 5) Validera inkommande struktur
-    for key in ("heat14", "heat15"):
+    # 5) Validera inkommande struktur – en nyckel "heat<N>" per nomineringsheat
+    for n in nom_heats:
+        key = f"heat{n}"
         if key not in nominations or not isinstance(nominations[key], dict):
             raise HTTPException(status_code=400, detail=f"Saknar {key} i body")
         for side in ("home", "away"):
             if side not in nominations[key] or len(nominations[key][side]) != 2:
                 raise HTTPException(status_code=400, detail=f"{key}: förväntar exakt 2 förare för {side}")
 
-    h14_home = nominations["heat14"]["home"]
-    h14_away = nominations["heat14"]["away"]
-    h15_home = nominations["heat15"]["home"]
-    h15_away = nominations["heat15"]["away"]
-
     # 6) Lagtillhörighet
-    if not set(h14_home).issubset(id_set_home): raise HTTPException(status_code=400, detail="Heat 14: home innehåller förare som inte tillhör hemmalaget")
-    if not set(h14_away).issubset(id_set_away): raise HTTPException(status_code=400, detail="Heat 14: away innehåller förare som inte tillhör bortalaget")
-    if not set(h15_home).issubset(id_set_home): raise HTTPException(status_code=400, detail="Heat 15: home innehåller förare som inte tillhör hemmalaget")
-    if not set(h15_away).issubset(id_set_away): raise HTTPException(status_code=400, detail="Heat 15: away innehåller förare som inte tillhör bortalaget")
-
-    # 7) Heat 15-regel: 2 av lagets 3 poängbästa ordinarie
-    if not set(h15_home).issubset(set(home_top3)) or not set(h15_away).issubset(set(away_top3)):
-        raise HTTPException(status_code=400, detail="Heat 15 måste vara 2 av lagets 3 poängbästa ordinarie (inkl bonus) för respektive lag")
+    for n in nom_heats:
+        picks = nominations[f"heat{n}"]
+        if not set(picks["home"]).issubset(id_set_home):
+            raise HTTPException(status_code=400, detail=f"Heat {n}: home innehåller förare som inte tillhör hemmalaget")
+        if not set(picks["away"]).issubset(id_set_away):
+            raise HTTPException(status_code=400, detail=f"Heat {n}: away innehåller förare som inte tillhör bortalaget")
+
+    # 7) Sista nomineringsheatet (15): 2 av lagets 3 poängbästa ordinarie
+    rules = (match.get("meta") or {}).get("rules") or DEFAULT_RULES
+    if (rules.get("nominations") or {}).get("heat15_top2_of_top3", True):
+        last = nom_heats[-1]
+        picks = nominations[f"heat{last}"]
+        if not set(picks["home"]).issubset(set(home_top3)) or not set(picks["away"]).issubset(set(away_top3)):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Heat {last} måste vara 2 av lagets 3 poängbästa ordinarie (inkl bonus) för respektive lag",
+            )
 
-    # 8) Applicera nomineringar på rätt gate/färg
-    # Mönster enligt tabellen:
-    #  Heat 14: gate1=(away,V), gate2=(home,R), gate3=(away,G), gate4=(home,B)
-    #  Heat 15: gate1=(home,R), gate2=(away,V), gate3=(home,B), gate4=(away,G)
+    # 8) Applicera nomineringar på rätt gate/färg enligt schemats mönster,
+    #    t.ex. heat 14: gate1=(away,V), gate2=(home,R), gate3=(away,G), gate4=(home,B)
 
     def assign_nomination(heat_num: int, home_ids: list[str], away_ids: list[str]) -> None:
         # Hämta heat
@@ -2011,57 +1996,38 @@ async def update_nominations(
             mp = {r["id"]: r for r in pool}
             return [mp[i] for i in ids]
 
-        H = get_riders(home_ids, home_riders_all)
-        A = get_riders(away_ids, away_riders_all)
-
-        if heat_num == 14:
-            pattern = {
-                "1": ("away", "V"),
-                "2": ("home", "R"),
-                "3": ("away", "G"),
-                "4": ("home", "B"),
-            }
-        else:  # 15
-            pattern = {
-                "1": ("home", "R"),
-                "2": ("away", "V"),
-                "3": ("home", "B"),
-                "4": ("away", "G"),
-            }
-
-        # Lägg ut enligt pattern – bevara ordningen i listorna
-        # home går på de gates där pattern[x][0] == "home", i given ordning
-        # away likadant
-        home_iter = iter(H)
-        away_iter = iter(A)
+        # home går på de gates där mönstret säger "home", i given ordning; away likadant
+        iters = {"home": iter(get_riders(home_ids, home_riders_all)),
+                 "away": iter(get_riders(away_ids, away_riders_all))}
         new_riders = {}
-
-        for gate, (who, color_letter) in pattern.items():
-            if who == "home":
-                r = next(home_iter)
-                new_riders[gate] = {
-                    "rider_id": r["id"],
-                    "name": r["name"],
-                    "team": "home",
-                    "helmet_color": COLOR_TO_HELMET[color_letter],
-                }
-            else:
-                r = next(away_iter)
-                new_riders[gate] = {
-                    "rider_id": r["id"],
-                    "name": r["name"],
-                    "team": "away",
-                    "helmet_color": COLOR_TO_HELMET[color_letter],
-                }
+        for gate, (who, color_letter) in schedule.nomination_pattern(heat_num).items():
+            r = next(iters[who])
+            new_riders[gate] = {
+                "rider_id": r["id"],
+                "name": r["name"],
+                "team": who,
+                "helmet_color": COLOR_TO_HELMET[color_letter],
+            }
 
         heat["riders"] = new_riders
         # Nominering sätter inte heatets status/resultat
 
-    assign_nomination(14, h14_home, h14_away)
-    assign_nomination(15, h15_home, h15_away)
+    heat_by_no = {h.get("heat_number"): h for h in match["heats"]}
+    old_riders = {n: dict(heat_by_no[n]["riders"]) for n in nom_heats if n in heat_by_no}
 
-    await matches_collection.update_one({"id": match_id}, {"$set": {"heats": match["heats"]}})
-    return {"message": "Nomineringar uppdaterade"}
+    for n in nom_heats:
+        assign_nomination(n, nominations[f"heat{n}"]["home"], nominations[f"heat{n}"]["away"])
+
+    delta: Dict[str, int] = {}
+    for n, before in old_riders.items():
+        for rid, d in _ride_count_delta(before, heat_by_no[n]["riders"]).items():
+            delta[rid] = delta.get(rid, 0) + d
+    update: Dict[str, Any] = {"$set": {f"heats.$[h{n}].riders": heat_by_no[n]["riders"] for n in nom_heats}}
+    _ride_counts_update(match, {rid: d for rid, d in delta.items() if d}, update)
+    version = await _update_match_versioned(
+        match, update, [{f"h{n}.heat_number": n} for n in nom_heats],
+    )
+    return {"message": "Nomineringar uppdaterade", "version": version}
 
 
 
@@ -2084,15 +2050,16 @@ async def confirm_match(
         raise HTTPException(status_code=404, detail="Match hittades inte")
 
     heats: List[Dict[str, Any]] = match.get("heats", [])
-    # 2) Fullständighetskontroll: 15 completed + minst 4 resultat per heat
-    if len(heats) < 15 or any(
+    # 2) Fullständighetskontroll: alla heat i schemat completed + minst 4 resultat per heat
+    total = len(_match_schedule(match).heats)
+    if len(heats) < total or any(
         (h.get("status") != "completed") or (len(h.get("results", [])) < 4)
         for h in heats
     ):
         completed = sum(1 for h in heats if h.get("status") == "completed")
         raise HTTPException(
             status_code=400,
-            detail=f"Match ej komplett. Klara heat: {completed}/15.",
+            detail=f"Match ej komplett. Klara heat: {completed}/{total}.",
         )
 
     # 3) Sätt matchstatus (idempotent; safe att köra flera gånger)
@@ -2188,59 +2155,87 @@ async def confirm_match(
 
 
 
+def _score_discrepancies(user_results: Dict[str, Any], official: Dict[str, Any]) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    for key in ("home_score", "away_score"):
+        if user_results.get(key) != official.get(key):
+            out.append({
+                "type": key,
+                "user_value": user_results.get(key),
+                "official_value": official.get(key),
+            })
+    return out
+
+
 @app.get("/api/user/matches")
-async def get_user_matches(user_id: str = Depends(verify_jwt_token)) -> List[Dict[str, Any]]:
+async def get_user_matches(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(verify_jwt_token),
+) -> List[Dict[str, Any]]:
     """
     Return all matches completed by the user, enriched with team names,
     and compute discrepancy/validation status compared to official results.
+
+    Matches, teams and official matches are fetched with one `$in` query
+    each instead of per row. With `limit`, rows are paged by `_id` and the
+    next cursor is returned in the `X-Next-Cursor` header.
     """
-    user_matches_cursor = user_matches_collection.find({"user_id": user_id}, {"_id": 0})
+    query: Dict[str, Any] = {"user_id": user_id}
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Ogiltig cursor")
+        query["_id"] = {"$gt": ObjectId(cursor)}
+    user_matches_cursor = user_matches_collection.find(query).sort("_id", 1)
+    if limit:
+        user_matches_cursor = user_matches_cursor.limit(limit + 1)
     user_matches = await user_matches_cursor.to_list(length=None)
+    if limit and len(user_matches) > limit:
+        user_matches = user_matches[:limit]
+        response.headers["X-Next-Cursor"] = str(user_matches[-1]["_id"])
+    for um in user_matches:
+        um.pop("_id", None)
+
+    match_ids = list({um["match_id"] for um in user_matches if um.get("match_id")})
+    matches = await matches_collection.find(
+        {"id": {"$in": match_ids}},
+        {"_id": 0, "id": 1, "home_team_id": 1, "away_team_id": 1, "date": 1, "venue": 1, "official_match_id": 1},
+    ).to_list(length=None)
+    match_by_id = {m["id"]: m for m in matches}
+
+    team_ids = list({m[k] for m in matches for k in ("home_team_id", "away_team_id") if m.get(k)})
+    teams = await teams_collection.find({"id": {"$in": team_ids}}, {"_id": 0, "id": 1, "name": 1}).to_list(length=None)
+    team_name = {t["id"]: t["name"] for t in teams}
+
+    official_ids = list({m["official_match_id"] for m in matches if m.get("official_match_id")})
+    officials = await official_matches_collection.find(
+        {"id": {"$in": official_ids}}, {"_id": 0, "id": 1, "home_score": 1, "away_score": 1}
+    ).to_list(length=None) if official_ids else []
+    official_by_id = {o["id"]: o for o in officials}
+
     for user_match in user_matches:
-        match = await matches_collection.find_one({"id": user_match["match_id"]})
+        match = match_by_id.get(user_match["match_id"])
         if not match:
             continue
-        home_team = await teams_collection.find_one({"id": match["home_team_id"]})
-        away_team = await teams_collection.find_one({"id": match["away_team_id"]})
         user_match["match_details"] = {
-            "home_team": home_team["name"] if home_team else "Okänt lag",
-            "away_team": away_team["name"] if away_team else "Okänt lag",
+            "home_team": team_name.get(match["home_team_id"], "Okänt lag"),
+            "away_team": team_name.get(match["away_team_id"], "Okänt lag"),
             "date": match.get("date"),
             "venue": match.get("venue", ""),
         }
-        official_match_id = match.get("official_match_id")
-        if official_match_id:
-            official = await official_matches_collection.find_one({"id": official_match_id})
-            if official and "home_score" in official and "away_score" in official:
-                discrepancies: List[Dict[str, Any]] = []
-                if user_match["user_results"].get("home_score") != official.get("home_score"):
-                    discrepancies.append({
-                        "type": "home_score",
-                        "user_value": user_match["user_results"].get("home_score"),
-                        "official_value": official.get("home_score"),
-                    })
-                if user_match["user_results"].get("away_score") != official.get("away_score"):
-                    discrepancies.append({
-                        "type": "away_score",
-                        "user_value": user_match["user_results"].get("away_score"),
-                        "official_value": official.get("away_score"),
-                    })
-                if discrepancies:
-                    user_match["status"] = "disputed"
-                    user_match["discrepancies"] = discrepancies
-                else:
-                    user_match["status"] = "validated"
-                    user_match["discrepancies"] = []
-                # Always include official results if present
-                user_match["official_results"] = {
-                    "home_score": official.get("home_score"),
-                    "away_score": official.get("away_score"),
-                }
-            else:
-                # No official score available
-                user_match["status"] = "complete"
-                user_match["discrepancies"] = []
+        official = official_by_id.get(match.get("official_match_id"))
+        if official and "home_score" in official and "away_score" in official:
+            discrepancies = _score_discrepancies(user_match["user_results"], official)
+            user_match["status"] = "disputed" if discrepancies else "validated"
+            user_match["discrepancies"] = discrepancies
+            # Always include official results if present
+            user_match["official_results"] = {
+                "home_score": official.get("home_score"),
+                "away_score": official.get("away_score"),
+            }
         else:
+            # No official match linked or no official score available
             user_match["status"] = "complete"
             user_match["discrepancies"] = []
     return user_matches
@@ -2311,34 +2306,49 @@ async def get_official_matches(user_id: str = Depends(verify_jwt_token)) -> List
     return matches
 
 
+async def _start_job(kind: str, params: Dict[str, Any], response: Response) -> Dict[str, Any]:
+    """
+    Queue an admin job and answer right away: 202 with the new job, or 200
+    with the job of the same kind that is already queued or running.
+    """
+    job, created = await job_runner.enqueue(kind, params)
+    response.status_code = 202 if created else 200
+    return {
+        "job_id": job["id"],
+        "kind": kind,
+        "status": job["status"],
+        "already_running": not created,
+        "status_url": f"/api/admin/jobs/{job['id']}",
+    }
+
+
+# Skraparna körs av worker.py (requirements-scraper.txt) – API:t köar bara jobbet
+job_runner.register_remote("import-official-matches")
+
+
 @app.post("/api/admin/import-official-matches")
-async def import_official_matches() -> Dict[str, Any]:
+async def import_official_matches(response: Response) -> Dict[str, Any]:
     """
-    Import official matches from an external source (e.g. flashscore). This
-    asynchronous implementation assumes that the scraping function returns a
-    list of match dictionaries. Each new match is inserted if it does not
-    already exist. Returns the number of matches imported and the total
+    Queue an import of official matches from Flashscore (see
+    services.official_import); `python worker.py run` picks it up. The job's
+    result holds the number of matches imported and updated and the total
     fetched.
     """
-    try:
-        from scraping.flashscore import fetch_official_speedway_matches_async  # type: ignore
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Import error: {e}")
-    try:
-        matches = await fetch_official_speedway_matches_async()  # synchronous function returns list
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Scraper error: {e}")
-    added = 0
-    for match in matches:
-        exists = await official_matches_collection.find_one({
-            "home_team": match["home_team"],
-            "away_team": match["away_team"],
-            "date": match["date"],
-        })
-        if not exists:
-            await official_matches_collection.insert_one(match)
-            added += 1
-    return {"imported_matches": added, "fetched": len(matches)}
+    return await _start_job("import-official-matches", {}, response)
+
+
+@app.get("/api/admin/jobs")
+async def list_jobs(kind: Optional[str] = None, limit: int = Query(20, ge=1, le=100)) -> List[Dict[str, Any]]:
+    return await job_runner.list(kind, limit)
+
+
+@app.get("/api/admin/jobs/{job_id}")
+async def get_job(job_id: str) -> Dict[str, Any]:
+    """Status, progress counters and (when finished) result or error of a job."""
+    job = await job_runner.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Jobb saknas")
+    return job
 
 
 
@@ -2467,13 +2477,7 @@ async def import_official_matches() -> Dict[str, Any]:
 
 
 
-@app.post("/api/admin/sync-teams-from-official")
-async def sync_teams_from_official() -> Dict[str, Any]:
-    """
-    Sync teams from official matches into the teams collection. Adds any
-    teams present in official matches but missing from the teams
-    collection. Returns the number of teams added.
-    """
+async def _job_sync_teams_from_official(params: Dict[str, Any], progress) -> Dict[str, Any]:
     official_cursor = official_matches_collection.find()
     official_teams: set[str] = set()
     async for m in official_cursor:
@@ -2492,9 +2496,24 @@ async def sync_teams_from_official() -> Dict[str, Any]:
             }
             await teams_collection.insert_one(new_team)
             added += 1
+            progress.set(teams_added=added)
+    roster_cache.invalidate()
+    team_resolver.invalidate()
     return {"message": f"{added} lag tillagda i teams"}
 
 
+job_runner.register("sync-teams-from-official", _job_sync_teams_from_official)
+
+
+@app.post("/api/admin/sync-teams-from-official")
+async def sync_teams_from_official(response: Response) -> Dict[str, Any]:
+    """
+    Start a background sync of teams from official matches: any team present
+    in official matches but missing from the teams collection is added.
+    """
+    return await _start_job("sync-teams-from-official", {}, response)
+
+
 
 # BE CHATGPT MED RULES OCHJ META SOM I VANLIGA CREATE_MATCH
 
@@ -2596,10 +2615,11 @@ async def create_match_from_official(
         # Tillåtet att återuppta pågående protokoll → returnera befintligt id
         return {"message": "Match fanns redan", "match_id": existing["id"]}
 
+    rules = _rules_for_schedule(body.schedule)
     heats: List[Dict[str, Any]] = await generate_match_heats(
         home["id"],
         away["id"],
-        DEFAULT_RULES,
+        rules,
     )
 
     match_id = str(uuid.uuid4())
@@ -2616,8 +2636,10 @@ async def create_match_from_official(
         "created_by": user_id,
         "created_at": datetime.utcnow(),
         "official_match_id": official["id"],
-        "meta": {"rules": DEFAULT_RULES},
+        "meta": {"rules": rules},
         # "match_key": match_key,  # <-- NYTT
+        "version": 0,
+        "ride_counts": _current_heat_counts({"heats": heats}),
     }
     try:
         await matches_collection.insert_one(match_doc)
@@ -2629,61 +2651,35 @@ async def create_match_from_official(
 
 
 
+job_runner.register_remote("import-official-heats")
+
+
 @app.post("/api/admin/import-official-heats")
-async def import_official_heats() -> Dict[str, Any]:
+async def import_official_heats(
+    response: Response,
+    force_refresh_days: int = Query(7, ge=0),
+    full: bool = False,
+) -> Dict[str, Any]:
     """
-    Import official heats from the SVEMO scraper. Deduplicates by
-    competition_id and reports the number of added records as well as
-    those skipped due to missing competition_id or duplication.
+    Queue an import of official heats from SVEMO (see
+    services.official_import) for `python worker.py run`. Competitions first seen within the last
+    `force_refresh_days` days are re-scraped; `full=true` re-scrapes all.
+    Progress (pages scraped, documents upserted) is on the job.
     """
-    try:
-        from scraping.svemo import fetch_all_svemo_heats  # type: ignore
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Import error: {e}")
-    try:
-        heats_data = await fetch_all_svemo_heats()  # asynchronous scraper
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Scraper error: {e}")
-    added = 0
-    skipped_no_comp = 0
-    duplicates = 0
-    total_processed = 0
-    for heat_doc in heats_data:
-        total_processed += 1
-        comp_id = heat_doc.get("competition_id")
-        if not comp_id:
-            skipped_no_comp += 1
-            continue
-        exists = await official_heats_collection.find_one({"competition_id": comp_id})
-        if exists:
-            duplicates += 1
-            continue
-        await official_heats_collection.insert_one(heat_doc)
-        added += 1
-    return {
-        "message": f"{added} heatmatcher importerade",
-        "fetched": len(heats_data),
-        "skipped_no_competition_id": skipped_no_comp,
-        "duplicates": duplicates,
-        "total_processed": total_processed,
-    }
+    return await _start_job("import-official-heats", {"force_refresh_days": force_refresh_days, "full": full}, response)
     
     # EN ENDPOINT FÖR ATT BACKFILLA match_key PÅ ALLA MATCHER SOM SAKNAR DETTA (NYTT FRÅN 2024-06-10)
     
 @app.post("/api/admin/backfill-match-keys")
 async def backfill_match_keys():
-    cur = matches_collection.find({"match_key": {"$exists": False}})
-    updated = 0
-    async for m in cur:
-        dt = m.get("date")
-        if isinstance(dt, str):
-            dt = datetime.fromisoformat(dt.replace("Z","+00:00")) if "Z" in dt else datetime.fromisoformat(dt)
-        elif not isinstance(dt, datetime):
-            continue
-        mk = build_match_key(m["home_team_id"], m["away_team_id"], dt)
-        await matches_collection.update_one({"_id": m["_id"]}, {"$set": {"match_key": mk}})
-        updated += 1
-    return {"ok": True, "updated": updated}
+    # Körs även som migration 3 vid uppstart; endpointen kör samma batchade backfill på begäran
+    counters = await _backfill_match_keys(db, MigrationContext.detached())
+    return {
+        "ok": True,
+        "updated": counters.get("updated", 0),
+        "conflicts": counters.get("conflicts", 0),
+        "skipped": counters.get("skipped", 0),  # saknar lag eller har ett datum som inte går att tolka
+    }
 
 
 
@@ -2708,6 +2704,14 @@ async def health_check() -> Dict[str, str]:
     return {"status": "ok", "service": "Speedway Elitserien API (Async)"}
 
 
+@app.get("/api/metrics", include_in_schema=False)
+async def metrics_endpoint(request: Request) -> Response:
+    """Prometheus text format. Kräver `Authorization: Bearer $METRICS_TOKEN` om den är satt."""
+    if metrics.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # =======================
 #  ACCOUNT ROUTER
 # =======================
@@ -2836,9 +2840,9 @@ async def account_profile(body: ProfileUpdate, user_id: str = Depends(verify_jwt
 @account_router.put("/password")
 async def account_password(body: PasswordChange, user_id: str = Depends(verify_jwt_token)):
     udoc = await users_collection.find_one({"id": user_id})
-    if not udoc or not verify_password(body.current_password, udoc["password"]):
+    if not udoc or not await verify_password_async(body.current_password, udoc["password"]):
         raise HTTPException(status_code=400, detail="Fel nuvarande lösenord")
-    hashed = hash_password(body.new_password)
+    hashed = await hash_password_async(body.new_password)
     await users_collection.update_one({"id": user_id}, {"$set": {"password": hashed}})
     return {"ok": True}
 
@@ -2906,6 +2910,7 @@ async def account_sessions_delete(session_id: str, request: Request, user_id: st
     _, fp = _device_label_and_fp(request)
     current = await sessions_collection.find_one({"user_id": user_id, "fingerprint": fp})
     res = await sessions_collection.delete_one({"id": session_id, "user_id": user_id})
+    session_cache.invalidate(user_id, session_id)
     if res.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Session ej hittad")
     return {"ok": True, "selfTerminated": bool(current and current.get("id") == session_id)}
@@ -2922,11 +2927,14 @@ async def account_sessions_delete_many(body: SessionsDeleteBody, request: Reques
         if fp:
             q["fingerprint"] = {"$ne": fp}
         await sessions_collection.delete_many(q)
+        # vi vet inte vilka jti som försvann – släpp hela användarens cache
+        session_cache.invalidate_user(user_id)
         return {"ok": True}
     raise HTTPException(status_code=400, detail="Ogiltigt scope")
 
 @account_router.post("/2fa/enable")
 async def account_2fa_enable(user_id: str = Depends(verify_jwt_token)):
+    pyotp = _pyotp()
     if not pyotp:
         # fallback om pyotp ej installerat – låter dig spara en hemlighet ändå
         secret = uuid.uuid4().hex[:16].upper()
@@ -2954,6 +2962,7 @@ async def account_2fa_verify(body: TwoFAVerify, user_id: str = Depends(verify_jw
     secret = (doc or {}).get("totp_secret_pending")
     if not secret:
         raise HTTPException(status_code=400, detail="Ingen 2FA-setup pågående")
+    pyotp = _pyotp()
     if not pyotp:
         raise HTTPException(status_code=400, detail="2FA kräver pyotp på servern")
     totp = pyotp.TOTP(secret)
@@ -2988,11 +2997,12 @@ async def account_export(user_id: str = Depends(verify_jwt_token)):
 async def account_delete(body: DeleteAccountBody, user_id: str = Depends(verify_jwt_token)):
     if body.password:
         doc = await users_collection.find_one({"id": user_id})
-        if not doc or not verify_password(body.password, doc["password"]):
+        if not doc or not await verify_password_async(body.password, doc["password"]):
             raise HTTPException(status_code=400, detail="Fel lösenord")
     await users_collection.delete_one({"id": user_id})
     await user_settings_collection.delete_one({"user_id": user_id})
     await sessions_collection.delete_many({"user_id": user_id})
+    session_cache.invalidate_user(user_id)
     await user_matches_collection.delete_many({"user_id": user_id})
     # matches skapade av user kan behållas (historik); ändra om du vill kaskadradera
     return {"ok": True}
@@ -0,0 +1,262 @@
+# services/indexes.py
+"""
+Declarative index registry for every collection the API queries.
+
+Alla index som API:t behöver listas i INDEXES och skapas idempotent vid
+uppstart (`apply_indexes`) eller från kommandoraden:
+
+    python -m services.indexes apply    # skapa saknade index
+    python -m services.indexes report   # saknade / avvikande / oanvända / odeklarerade
+    python -m services.indexes check    # explain() på varje endpoint-query
+
+`check` kör QUERY_SHAPES – the filters and sorts the endpoints actually
+issue – through explain() and exits non-zero if any of them ends up as a
+collection scan. Run it against a database where `apply` has run.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger("uvicorn.error")
+
+Keys = Tuple[Tuple[str, int], ...]
+
+
+class IndexSpec(NamedTuple):
+    collection: str
+    keys: Keys
+    name: str
+    options: Dict[str, Any] = {}
+
+    def create_kwargs(self) -> Dict[str, Any]:
+        return {"name": self.name, **self.options}
+
+
+def ix(collection: str, keys, name: str, **options: Any) -> IndexSpec:
+    if isinstance(keys, str):
+        keys = [(keys, 1)]
+    return IndexSpec(collection, tuple(keys), name, options)
+
+
+INDEXES: List[IndexSpec] = [
+    # users
+    ix("users", "id", "uniq_user_id", unique=True),
+    ix("users", "username_cf", "uniq_username_cf", unique=True),
+    ix("users", "email", "users_email"),
+    # teams / riders
+    ix("teams", "id", "uniq_team_id", unique=True),
+    ix("teams", "name", "teams_name"),
+    ix("riders", "id", "uniq_rider_id", unique=True),
+    ix("riders", "team_id", "riders_team_id"),
+    # matches
+    ix("matches", "id", "uniq_match_id", unique=True),
+    ix("matches", [("created_by", 1), ("date", 1)], "matches_created_by_date"),
+    # (partial -> påverkar endast dokument som har "match_key")
+    ix("matches", [("created_by", 1), ("match_key", 1)], "uniq_user_match_key", unique=True,
+       partialFilterExpression={"match_key": {"$exists": True, "$type": "string"}}),
+    # user_matches – äldre dokument saknar "id", därför inte unikt
+    ix("user_matches", [("user_id", 1), ("match_id", 1)], "user_matches_user_match"),
+    ix("user_matches", [("user_id", 1), ("_id", 1)], "user_matches_user_keyset"),
+    ix("user_matches", "id", "user_matches_id"),
+    # official_*
+    ix("official_matches", "id", "uniq_official_match_id", unique=True),
+    ix("official_matches", "used", "official_matches_used"),
+    ix("official_matches", [("home_team", 1), ("away_team", 1), ("date", 1)], "uniq_official_match", unique=True),
+    ix("official_heats", "competition_id", "uniq_competition_id", unique=True),
+    ix("official_heats", "first_scraped_at", "official_heats_first_scraped"),
+    # sessions
+    ix("sessions", [("user_id", 1), ("fingerprint", 1)], "uniq_session_fp", unique=True),
+    ix("sessions", "id", "sessions_id"),
+    ix("sessions", [("user_id", 1), ("last_active", -1)], "sessions_user_time"),
+    ix("sessions", "last_active", "ttl_last_active_30d", expireAfterSeconds=60 * 60 * 24 * 30),
+    # user_settings
+    ix("user_settings", "user_id", "uniq_user_settings", unique=True),
+    # jobs (services/jobs.py)
+    ix("jobs", "id", "uniq_job_id", unique=True),
+    ix("jobs", "kind", "uniq_active_job_kind", unique=True, partialFilterExpression={"active": True}),
+    ix("jobs", [("kind", 1), ("created_at", -1)], "jobs_kind_created"),
+]
+
+
+class QueryShape(NamedTuple):
+    collection: str
+    filter: Dict[str, Any]
+    sort: Optional[List[Tuple[str, int]]] = None
+    where: str = ""
+
+
+# Representativa queries från endpoints (värdena spelar ingen roll för planen)
+QUERY_SHAPES: List[QueryShape] = [
+    QueryShape("users", {"id": "x"}, where="verify/account"),
+    QueryShape("users", {"username_cf": "x"}, where="login"),
+    QueryShape("users", {"email": "x", "id": {"$ne": "y"}}, where="PATCH account"),
+    QueryShape("teams", {"id": "x"}, where="get_team, matches"),
+    QueryShape("teams", {"id": {"$in": ["x"]}}, where="get_user_matches"),
+    QueryShape("teams", {"name": "x"}, where="sync-teams"),
+    QueryShape("riders", {"id": {"$in": ["x"]}}, where="validate_heat_rider_change"),
+    QueryShape("riders", {"team_id": "x"}, where="roster_cache"),
+    QueryShape("matches", {"id": "x"}, where="get_match, heat updates"),
+    QueryShape("matches", {"id": {"$in": ["x"]}}, where="get_user_matches"),
+    QueryShape("matches", {"created_by": "u", "match_key": "k"}, where="create_match"),
+    QueryShape("matches", {"created_by": "u", "home_team_id": "h", "away_team_id": "a", "date": 0},
+               where="_already_finalized_for_user"),
+    QueryShape("matches", {"created_by": "u"}, where="account stats/export"),
+    QueryShape("user_matches", {"user_id": "u", "match_id": "m"}, where="finalize"),
+    QueryShape("user_matches", {"user_id": "u"}, sort=[("_id", 1)], where="get_user_matches"),
+    QueryShape("user_matches", {"id": "x", "user_id": "u"}, where="user match detail"),
+    QueryShape("official_matches", {"id": "x"}, where="from-official"),
+    QueryShape("official_matches", {"id": {"$in": ["x"]}}, where="get_user_matches"),
+    QueryShape("official_matches", {"used": {"$ne": True}}, where="get_official_matches"),
+    QueryShape("official_heats", {"competition_id": {"$in": [1]}}, where="import heats"),
+    QueryShape("sessions", {"user_id": "u", "id": "j"}, where="verify_jwt_token"),
+    QueryShape("sessions", {"user_id": "u", "fingerprint": "f"}, where="login"),
+    QueryShape("sessions", {"user_id": "u"}, sort=[("last_active", -1)], where="sessions list/stats"),
+    QueryShape("sessions", {"id": "j"}, where="delete session"),
+    QueryShape("user_settings", {"user_id": "u"}, where="settings"),
+    QueryShape("jobs", {"id": "x"}, where="job status"),
+    QueryShape("jobs", {"kind": {"$in": ["x"]}, "status": "queued", "active": True},
+               sort=[("created_at", 1)], where="job claim"),
+]
+
+
+def _normalize(value: Any) -> Any:
+    # index_information() ger SON/float; jämför som vanliga dicts/ints
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _same(spec: IndexSpec, info: Dict[str, Any]) -> bool:
+    if tuple((k, int(d)) for k, d in info["key"]) != spec.keys:
+        return False
+    if bool(info.get("unique")) != bool(spec.options.get("unique")):
+        return False
+    return all(
+        _normalize(info.get(opt)) == _normalize(spec.options.get(opt))
+        for opt in ("partialFilterExpression", "expireAfterSeconds")
+    )
+
+
+async def apply_indexes(db, specs: List[IndexSpec] = INDEXES) -> Dict[str, List[str]]:
+    """
+    Create every declared index that is missing. Existing indexes with the
+    same name but another definition are left alone and reported as
+    "conflicts" – fix them by hand (drop + apply).
+    """
+    created: List[str] = []
+    conflicts: List[str] = []
+    failed: List[str] = []
+    existing: Dict[str, Dict[str, Any]] = {}
+    for spec in specs:
+        if spec.collection not in existing:
+            existing[spec.collection] = await db[spec.collection].index_information()
+        info = existing[spec.collection]
+        label = f"{spec.collection}.{spec.name}"
+        if spec.name in info:
+            if not _same(spec, info[spec.name]):
+                conflicts.append(label)
+            continue
+        if any(_same(spec, i) for i in info.values()):
+            continue  # samma index finns under annat namn
+        try:
+            await db[spec.collection].create_index(list(spec.keys), **spec.create_kwargs())
+            created.append(label)
+        except OperationFailure as e:
+            # t.ex. dubbletter som hindrar ett unikt index – låt servern starta
+            logger.warning("index %s not created: %s", label, e)
+            failed.append(label)
+    for label in conflicts:
+        logger.warning("index %s exists with another definition", label)
+    return {"created": created, "conflicts": conflicts, "failed": failed}
+
+
+async def index_report(db, specs: List[IndexSpec] = INDEXES) -> Dict[str, List[str]]:
+    declared: Dict[str, Dict[str, IndexSpec]] = {}
+    for spec in specs:
+        declared.setdefault(spec.collection, {})[spec.name] = spec
+    report: Dict[str, List[str]] = {"missing": [], "conflicts": [], "undeclared": [], "unused": []}
+    for coll, wanted in declared.items():
+        info = await db[coll].index_information()
+        for name, spec in wanted.items():
+            if name not in info:
+                report["missing"].append(f"{coll}.{name}")
+            elif not _same(spec, info[name]):
+                report["conflicts"].append(f"{coll}.{name}")
+        for name in info:
+            if name != "_id_" and name not in wanted:
+                report["undeclared"].append(f"{coll}.{name}")
+        try:
+            async for st in db[coll].aggregate([{"$indexStats": {}}]):
+                if st["name"] != "_id_" and not st.get("accesses", {}).get("ops"):
+                    since = st.get("accesses", {}).get("since")
+                    report["unused"].append(f"{coll}.{st['name']} (sedan {since})")
+        except OperationFailure:
+            pass  # $indexStats kräver rättigheter som inte alla miljöer har
+    return report
+
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    stages = [plan.get("stage", "")]
+    for child_key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(child_key), dict):
+            stages += _plan_stages(plan[child_key])
+    for child in plan.get("inputStages", []) or []:
+        stages += _plan_stages(child)
+    return stages
+
+
+async def check_queries(db, shapes: List[QueryShape] = QUERY_SHAPES) -> List[str]:
+    """Explain every query shape; return the ones that would scan the collection."""
+    failures = []
+    for shape in shapes:
+        cursor = db[shape.collection].find(shape.filter)
+        if shape.sort:
+            cursor = cursor.sort(shape.sort)
+        explain = await cursor.explain()
+        stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+        ok = "COLLSCAN" not in stages and any(s in ("IXSCAN", "IDHACK", "EXPRESS_IXSCAN") for s in stages)
+        print(f"{'OK  ' if ok else 'FAIL'} {shape.collection:18} {shape.where:30} {' > '.join(s for s in stages if s)}")
+        if not ok:
+            failures.append(f"{shape.collection} {shape.filter} ({shape.where})")
+    return failures
+
+
+async def _main(command: str) -> int:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL"))
+    db = client["speedway_elitserien"]
+    try:
+        if command == "apply":
+            result = await apply_indexes(db)
+            for key, labels in result.items():
+                print(f"{key}: {', '.join(labels) or '-'}")
+            return 1 if result["failed"] or result["conflicts"] else 0
+        if command == "report":
+            report = await index_report(db)
+            for key, labels in report.items():
+                print(f"{key}:")
+                for label in labels:
+                    print(f"  {label}")
+            return 1 if report["missing"] or report["conflicts"] else 0
+        failures = await check_queries(db)
+        if failures:
+            print(f"\n{len(failures)} query(s) utan index")
+        return 1 if failures else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "report"
+    if cmd not in ("apply", "report", "check"):
+        print("usage: python -m services.indexes [apply|report|check]")
+        sys.exit(2)
+    sys.exit(asyncio.run(_main(cmd)))
@@ -0,0 +1,253 @@
+# services/jobs.py
+"""
+Background jobs for long-running admin work (scraper imports, team sync).
+
+Jobb lagras i Mongo-collectionen `jobs`. `enqueue` inserts a job as
+"queued"; a process that has a handler for the kind claims it atomically
+(queued -> running) and runs it as an asyncio task. Kinds registered with
+`register_remote` are only enqueued here and run by another process –
+the scraper imports are run by `worker.py run`, so the API never needs the
+scraper dependencies. An active (queued or running) job carries
+`active: true`; a unique partial index on `kind` over active jobs guarantees
+at most one job of each kind, whichever process enqueued it.
+
+Running jobs write a heartbeat (and their progress counters) every few
+seconds. A job whose process died is recognised by a stale heartbeat and put
+back in the queue, up to JOB_MAX_ATTEMPTS starts; after that it is marked
+failed. A job cancelled by a clean shutdown goes back to the queue without
+using up an attempt. Handlers therefore have to be safe to re-run from the
+start (the imports upsert, team sync skips existing teams).
+
+Handlers are `async def handler(params, progress) -> dict`; `progress.set()`
+and `progress.incr()` are synchronous and only update memory – the heartbeat
+loop persists them.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger("uvicorn.error")
+
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "5"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5"))
+
+Handler = Callable[[Dict[str, Any], "JobProgress"], Awaitable[Dict[str, Any]]]
+
+
+class JobProgress:
+    def __init__(self) -> None:
+        self.counters: Dict[str, Any] = {}
+        self.dirty = False
+
+    def set(self, **values: Any) -> None:
+        self.counters.update(values)
+        self.dirty = True
+
+    def incr(self, key: str, n: int = 1) -> None:
+        self.counters[key] = self.counters.get(key, 0) + n
+        self.dirty = True
+
+
+def _public(job: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if job is None:
+        return None
+    job = dict(job)
+    job.pop("_id", None)
+    job.pop("active", None)
+    return job
+
+
+class JobRunner:
+    def __init__(self) -> None:
+        self._collection = None
+        self._handlers: Dict[str, Handler] = {}
+        self._remote: Set[str] = set()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    def register_remote(self, kind: str) -> None:
+        """A kind this process may enqueue but another process (worker.py) runs."""
+        self._remote.add(kind)
+
+    async def init(self, collection, resume: bool = True) -> None:
+        """
+        Recover jobs whose process died and, with `resume`, start queued jobs
+        this process has handlers for. Indexes for `jobs` are declared in
+        services/indexes.py.
+        """
+        self._collection = collection
+        requeued, failed = await self._recover_stale()
+        if requeued or failed:
+            logger.warning("stale jobs: %d requeued, %d marked failed", requeued, failed)
+        if resume:
+            await self.run_pending()
+
+    async def _recover_stale(self, kind: Optional[str] = None) -> Tuple[int, int]:
+        query: Dict[str, Any] = {
+            "active": True,
+            "status": "running",
+            "heartbeat_at": {"$lt": datetime.utcnow() - timedelta(seconds=JOB_STALE_AFTER)},
+        }
+        if kind:
+            query["kind"] = kind
+        failed = await self._collection.update_many({**query, "attempts": {"$gte": JOB_MAX_ATTEMPTS}}, {
+            "$set": {"status": "failed", "error": "avbröts för många gånger (processen dog)",
+                     "finished_at": datetime.utcnow()},
+            "$unset": {"active": "", "owner": ""},
+        })
+        requeued = await self._collection.update_many(query, {
+            "$set": {"status": "queued"},
+            "$unset": {"owner": ""},
+        })
+        return requeued.modified_count, failed.modified_count
+
+    async def enqueue(self, kind: str, params: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue a job of `kind` and start it here if this process has its
+        handler. Returns (job, created); when a job of that kind is already
+        queued or running, that job is returned with created=False.
+        """
+        if kind not in self._handlers and kind not in self._remote:
+            raise KeyError(kind)
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "params": params or {},
+            "status": "queued",
+            "active": True,
+            "attempts": 0,
+            "progress": {},
+            "created_at": datetime.utcnow(),
+        }
+        for attempt in range(2):
+            try:
+                await self._collection.insert_one(job)
+                break
+            except DuplicateKeyError:
+                # ett aktivt jobb finns – om dess process dog, återställ och försök en gång till
+                if attempt == 0 and sum(await self._recover_stale(kind)):
+                    await self.run_pending([kind])
+                    continue
+                existing = await self._collection.find_one({"kind": kind, "active": True}, {"_id": 0})
+                if existing:
+                    return _public(existing), False
+                raise
+        job.pop("_id", None)
+        if kind in self._handlers:
+            job = await self._claim({"id": job["id"]}) or job
+        return _public(job), True
+
+    async def _claim(self, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        job = await self._collection.find_one_and_update(
+            {**query, "status": "queued", "active": True},
+            {"$set": {"status": "running", "owner": self.owner, "started_at": now, "heartbeat_at": now},
+             "$inc": {"attempts": 1}},
+            projection={"_id": 0},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if job:
+            self._tasks[job["id"]] = asyncio.create_task(self._run(job))
+        return job
+
+    async def run_pending(self, kinds: Optional[List[str]] = None) -> int:
+        """Claim and start every queued job of a kind this process has a handler for."""
+        kinds = [k for k in (kinds or self._handlers) if k in self._handlers]
+        started = 0
+        while kinds and await self._claim({"kind": {"$in": kinds}}):
+            started += 1
+        return started
+
+    async def work(self, once: bool = False, poll_interval: float = JOB_POLL_INTERVAL) -> None:
+        """
+        Worker loop: recover stale jobs and run queued ones until cancelled.
+        With `once`, return when nothing is running or queued.
+        """
+        while True:
+            await self._recover_stale()
+            await self.run_pending()
+            if not self._tasks:
+                if once:
+                    return
+                await asyncio.sleep(poll_interval)
+                continue
+            await asyncio.wait(list(self._tasks.values()), timeout=poll_interval)
+
+    async def wait(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Wait for a job running in this process; returns its final state."""
+        task = self._tasks.get(job_id)
+        if task:
+            await asyncio.gather(task, return_exceptions=True)
+        return await self.get(job_id)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        progress = JobProgress()
+        progress.counters.update(job.get("progress") or {})
+        beat = asyncio.create_task(self._heartbeat(job["id"], progress))
+        update: Dict[str, Any]
+        try:
+            result = await self._handlers[job["kind"]](job["params"], progress)
+            update = {"status": "succeeded", "result": result}
+        except asyncio.CancelledError:
+            # nedstängning: tillbaka i kön, nästa process tar vid
+            await self._collection.update_one(
+                {"id": job["id"], "owner": self.owner},
+                {"$set": {"status": "queued", "progress": progress.counters},
+                 "$unset": {"owner": ""}, "$inc": {"attempts": -1}},
+            )
+            return
+        except Exception as e:
+            logger.exception("job %s (%s) failed", job["id"], job["kind"])
+            update = {"status": "failed", "error": str(e) or type(e).__name__}
+        finally:
+            beat.cancel()
+            self._tasks.pop(job["id"], None)
+        update.update({"progress": progress.counters, "finished_at": datetime.utcnow()})
+        await self._collection.update_one(
+            {"id": job["id"], "owner": self.owner}, {"$set": update, "$unset": {"active": ""}})
+
+    async def _heartbeat(self, job_id: str, progress: JobProgress) -> None:
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            fields: Dict[str, Any] = {"heartbeat_at": datetime.utcnow()}
+            if progress.dirty:
+                progress.dirty = False
+                fields["progress"] = dict(progress.counters)
+            try:
+                await self._collection.update_one(
+                    {"id": job_id, "active": True, "owner": self.owner}, {"$set": fields})
+            except Exception as e:
+                logger.warning("job heartbeat failed: %s", e)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return _public(await self._collection.find_one({"id": job_id}, {"_id": 0}))
+
+    async def list(self, kind: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        query = {"kind": kind} if kind else {}
+        cursor = self._collection.find(query, {"_id": 0}).sort("created_at", -1).limit(limit)
+        return [_public(j) for j in await cursor.to_list(length=limit)]
+
+    async def stop(self) -> None:
+        """Cancel this process' running jobs; they go back to the queue."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+job_runner = JobRunner()
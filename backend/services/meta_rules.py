@@ -1,5 +1,6 @@
 #services/meta_rules.py
 DEFAULT_RULES = {
+    "schedule": "elitserien_2_15_7",  # namn i helpers.schedule_elit.SCHEDULES
     "tactical": {               # Taktisk reserv (TR)
         "enabled": True,
         "start_heat": 5,
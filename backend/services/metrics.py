@@ -0,0 +1,337 @@
+# services/metrics.py
+"""
+In-process metrics exposed in Prometheus text format on /api/metrics.
+
+Mätvärdena hålls i vanliga dicts i processen (ingen prometheus_client):
+
+- http_requests_total{method,route,status}
+- http_request_duration_seconds{method,route}       (histogram)
+- http_request_mongo_commands{method,route}         (histogram, commands per request)
+- mongodb_command_duration_seconds{command,collection} (histogram)
+- mongodb_command_failures_total{command,collection}
+
+`route` is the route template ("/api/matches/{match_id}"), never the raw
+path, so label cardinality is bounded by the number of endpoints. Requests
+that match no route are recorded as "unmatched".
+
+Mongo commands are observed through a pymongo CommandListener passed to the
+client (`event_listeners=[command_listener]`). Motor runs pymongo in a thread
+pool with a copy of the caller's context, so the listener can attribute each
+command to the request that issued it through a contextvar holding a mutable
+RequestStats. Each process exports its own numbers; with several uvicorn
+workers Prometheus scrapes them as separate targets or sums them.
+
+Query budget (utveckling/test): with MONGO_QUERY_BUDGET_MODE=warn or strict
+every response gets an `X-Mongo-Queries` header, and a request is flagged when
+it issues more than MONGO_QUERY_BUDGET commands (per route: `@query_budget(n)`)
+or more than MONGO_QUERY_REPEAT_LIMIT structurally identical commands against
+one collection – the N+1 pattern of a query inside a loop. "warn" logs the
+route and the repeated shapes; "strict" replaces the response with a 500 so
+tests fail on it. Default is "off": shapes are then never computed.
+"""
+
+import collections
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger("uvicorn.error")
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+QUERY_BUDGET_MODE = os.getenv("MONGO_QUERY_BUDGET_MODE", "off").lower()  # off | warn | strict
+QUERY_BUDGET = int(os.getenv("MONGO_QUERY_BUDGET", "20"))
+QUERY_REPEAT_LIMIT = int(os.getenv("MONGO_QUERY_REPEAT_LIMIT", "5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+Labels = Tuple[str, ...]
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str]) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Labels, n: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + n
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_num(value)}")
+        return lines
+
+
+class Histogram:
+    """Fixed buckets; each series is [count per bucket..., +Inf count, sum]."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], buckets: Sequence[float]) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Labels, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                le = _labels(self.labelnames + ("le",), labels + (_num(bound),))
+                lines.append(f"{self.name}_bucket{le} {_num(cumulative)}")
+            count = cumulative + series[-2]
+            le = _labels(self.labelnames + ("le",), labels + ("+Inf",))
+            lines.append(f"{self.name}_bucket{le} {_num(count)}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {_num(count)}")
+        return lines
+
+
+def _num(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in zip(names, values)) + "}"
+
+
+http_requests = Counter(
+    "http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"))
+http_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("method", "route"), LATENCY_BUCKETS)
+http_mongo_commands = Histogram(
+    "http_request_mongo_commands", "MongoDB commands issued per HTTP request.", ("method", "route"), COUNT_BUCKETS)
+mongo_duration = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency.", ("command", "collection"), MONGO_BUCKETS)
+mongo_failures = Counter(
+    "mongodb_command_failures_total", "Failed MongoDB commands.", ("command", "collection"))
+
+REGISTRY = [http_requests, http_duration, http_mongo_commands, mongo_duration, mongo_failures]
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---- per request ------------------------------------------------------------
+
+class RequestStats:
+    __slots__ = ("commands", "mongo_seconds", "shapes")
+
+    def __init__(self, track_shapes: bool = False) -> None:
+        self.commands = 0
+        self.mongo_seconds = 0.0
+        # "find teams {id:?}" -> antal; bara när budgeten är påslagen
+        self.shapes: Optional[collections.Counter] = collections.Counter() if track_shapes else None
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "request_stats", default=None)
+
+
+def current_request() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+def query_budget(n: int) -> Callable:
+    """Override MONGO_QUERY_BUDGET for one endpoint (place below @app.get)."""
+    def decorate(fn: Callable) -> Callable:
+        fn.__query_budget__ = n
+        return fn
+    return decorate
+
+
+def _shape(value: Any) -> str:
+    # Strukturen utan värden: {id:{$in:[?]}} för både 1 och 500 id:n
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{k}:{_shape(v)}" for k, v in sorted(value.items())) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + (_shape(value[0]) if value else "") + "]"
+    return "?"
+
+
+def command_shape(name: str, collection: str, command: Dict[str, Any]) -> str:
+    if name in ("find", "count", "distinct", "findAndModify"):
+        body: Any = command.get("filter", command.get("query"))
+        if name == "distinct":
+            body = {"key": command.get("key"), "query": body}
+    elif name == "aggregate":
+        body = command.get("pipeline")
+    elif name == "update":
+        body = [u.get("q") for u in command.get("updates", [])]
+    elif name == "delete":
+        body = [d.get("q") for d in command.get("deletes", [])]
+    else:
+        body = None
+    return f"{name} {collection} {_shape(body) if body is not None else ''}".rstrip()
+
+
+def budget_violations(stats: RequestStats, budget: int = QUERY_BUDGET,
+                      repeat_limit: int = QUERY_REPEAT_LIMIT) -> List[str]:
+    problems = []
+    if stats.commands > budget:
+        problems.append(f"{stats.commands} Mongo commands (budget {budget})")
+    for shape, n in (stats.shapes or {}).items():
+        if n > repeat_limit:
+            problems.append(f"{n}x {shape}")
+    return problems
+
+
+# ---- Mongo ------------------------------------------------------------------
+
+# Kommandon som drivern skickar själv (handshake, sessions) räknas inte
+_IGNORED_COMMANDS = frozenset({
+    "hello", "ismaster", "isMaster", "ping", "buildinfo", "buildInfo", "endSessions",
+    "saslStart", "saslContinue", "getnonce", "authenticate",
+})
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    def __init__(self) -> None:
+        # (request_id, operation_id) -> (collection, RequestStats)
+        self._inflight: Dict[Tuple[int, int], Tuple[str, Optional[RequestStats]]] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name in _IGNORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = "-"  # t.ex. getMore (cursor-id) eller admin-kommandon
+            if event.command_name == "getMore":
+                collection = event.command.get("collection", "-")
+        stats = _request_stats.get()
+        if stats is not None and stats.shapes is not None and event.command_name != "getMore":
+            stats.shapes[command_shape(event.command_name, collection, event.command)] += 1
+        self._inflight[(event.request_id, event.operation_id)] = (collection, stats)
+
+    def _finish(self, event, failed: bool) -> None:
+        entry = self._inflight.pop((event.request_id, event.operation_id), None)
+        if entry is None:
+            return
+        collection, stats = entry
+        seconds = event.duration_micros / 1_000_000
+        labels = (event.command_name, collection)
+        mongo_duration.observe(labels, seconds)
+        if failed:
+            mongo_failures.inc(labels)
+        if stats is not None:
+            stats.commands += 1
+            stats.mongo_seconds += seconds
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event, failed=True)
+
+
+command_listener = MongoCommandListener()
+
+
+# ---- HTTP -------------------------------------------------------------------
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: records count, latency and Mongo commands per route."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+        budget_on = QUERY_BUDGET_MODE in ("warn", "strict")
+        stats = RequestStats(track_shapes=budget_on)
+        token = _request_stats.set(stats)
+        replaced = False
+
+        async def send_wrapper(message) -> None:
+            nonlocal status_code, replaced
+            if replaced:
+                return  # ursprungliga svaret ersattes i strict-läge
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if budget_on:
+                    if QUERY_BUDGET_MODE == "strict":
+                        problems = budget_violations(stats, _route_budget(scope))
+                        if problems:
+                            replaced = True
+                            await _send_budget_error(send, scope, stats, problems)
+                            return
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-mongo-queries", str(stats.commands).encode())]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t0
+            _request_stats.reset(token)
+            # Routern lägger den matchade routen i scope efter matchning
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope.get("method", "")
+            http_requests.inc((method, route, str(status_code)))
+            http_duration.observe((method, route), elapsed)
+            http_mongo_commands.observe((method, route), stats.commands)
+            if QUERY_BUDGET_MODE == "warn":
+                problems = budget_violations(stats, _route_budget(scope))
+                if problems:
+                    logger.warning("[QUERY BUDGET] %s %s: %s", method, route, "; ".join(problems))
+
+
+def _route_budget(scope) -> int:
+    endpoint = getattr(scope.get("route"), "endpoint", None)
+    return getattr(endpoint, "__query_budget__", QUERY_BUDGET)
+
+
+async def _send_budget_error(send, scope, stats: RequestStats, problems: List[str]) -> None:
+    route = getattr(scope.get("route"), "path", None) or "unmatched"
+    logger.error("[QUERY BUDGET] %s %s: %s", scope.get("method", ""), route, "; ".join(problems))
+    body = json.dumps({"detail": "Mongo query budget exceeded", "route": route, "problems": problems}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 500,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"x-mongo-queries", str(stats.commands).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
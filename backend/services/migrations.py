@@ -0,0 +1,295 @@
+# services/migrations.py
+"""
+Versioned data migrations.
+
+Collectionen `migrations` håller ett schema-dokument (`_id: "schema"`) med
+aktuell version och ett lås, plus ett dokument per migration med status,
+checkpoint, räknare och tidsåtgång. Startup reads the schema document once
+and returns immediately when it is at LATEST_VERSION, so applied migrations
+cost a single find_one per process start.
+
+When something is pending, one worker takes the lock (a lease that is renewed
+on every checkpoint and expires if the worker dies), runs the pending
+migrations in order and bumps the version after each one. Other workers do
+not wait – they start without migrating. Migrations work in batches of
+`bulk_write` and store a checkpoint (the last `_id` handled), so a migration
+that was interrupted continues where it stopped on the next start.
+
+    python -m services.migrations status
+    python -m services.migrations run
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from helpers.match_keys import build_match_key, match_date
+
+logger = logging.getLogger("uvicorn.error")
+
+SCHEMA_DOC = "schema"
+MIGRATION_BATCH = int(os.getenv("MIGRATION_BATCH", "1000"))
+MIGRATION_LOCK_TTL = float(os.getenv("MIGRATION_LOCK_TTL", "120"))
+
+
+class MigrationContext:
+    """Checkpoint, counters and lock renewal for one running migration."""
+
+    def __init__(self, collection, migration_id: str, owner: str,
+                 checkpoint: Any = None, counters: Optional[Dict[str, int]] = None) -> None:
+        self._collection = collection
+        self.migration_id = migration_id
+        self.owner = owner
+        self.checkpoint = checkpoint
+        self.counters: Dict[str, int] = dict(counters or {})
+
+    @classmethod
+    def detached(cls) -> "MigrationContext":
+        """Context that persists nothing – for running a migration body ad hoc."""
+        return cls(None, "", "")
+
+    def incr(self, key: str, n: int = 1) -> None:
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    async def save(self, checkpoint: Any) -> None:
+        self.checkpoint = checkpoint
+        if self._collection is None:
+            return
+        await self._collection.update_one(
+            {"_id": self.migration_id},
+            {"$set": {"checkpoint": checkpoint, "counters": self.counters, "updated_at": datetime.utcnow()}},
+        )
+        await _renew_lock(self._collection, self.owner)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    fn: Callable[[Any, MigrationContext], Awaitable[Dict[str, Any]]]
+
+    @property
+    def id(self) -> str:
+        return f"{self.version:04d}_{self.name}"
+
+
+async def batched_update(collection, query: Dict[str, Any], projection: Dict[str, Any],
+                         make_update: Callable[[Dict[str, Any]], Optional[UpdateOne]],
+                         ctx: MigrationContext, batch_size: int = MIGRATION_BATCH) -> None:
+    """
+    Walk `query` in `_id` order from the checkpoint and apply the UpdateOne
+    returned by `make_update` (None = skip) in unordered bulk writes.
+    Duplicate-key errors are counted as "conflicts" instead of failing.
+    """
+    if ctx.checkpoint is not None:
+        query = {**query, "_id": {"$gt": ctx.checkpoint}}
+    cursor = collection.find(query, projection).sort("_id", 1).batch_size(batch_size)
+    ops: List[UpdateOne] = []
+    last_id = None
+
+    async def flush() -> None:
+        if ops:
+            try:
+                res = await collection.bulk_write(ops, ordered=False)
+                ctx.incr("updated", res.modified_count)
+            except BulkWriteError as e:
+                details = e.details or {}
+                dupes = sum(1 for err in details.get("writeErrors", []) if err.get("code") == 11000)
+                if dupes != len(details.get("writeErrors", [])):
+                    raise
+                ctx.incr("updated", details.get("nModified", 0))
+                ctx.incr("conflicts", dupes)
+            ops.clear()
+        if last_id is not None:
+            await ctx.save(last_id)
+
+    async for doc in cursor:
+        last_id = doc["_id"]
+        op = make_update(doc)
+        if op is None:
+            ctx.incr("skipped")
+        else:
+            ops.append(op)
+        if len(ops) >= batch_size:
+            await flush()
+    await flush()
+
+
+# ---- migrations -------------------------------------------------------------
+
+async def dedupe_sessions(db, ctx: MigrationContext) -> Dict[str, Any]:
+    """
+    Keep the most recently active session per (user_id, fingerprint) and
+    delete the rest, so the unique index uniq_session_fp can be built.
+    Grupperingen görs i databasen; bara _id för dubbletterna hämtas.
+    """
+    sessions = db["sessions"]
+    pipeline = [
+        {"$sort": {"user_id": 1, "fingerprint": 1, "last_active": -1}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "fingerprint": "$fingerprint"},
+            "keep": {"$first": "$_id"},
+            "ids": {"$push": "$_id"},
+            "n": {"$sum": 1},
+        }},
+        {"$match": {"n": {"$gt": 1}}},
+        {"$project": {"_id": 0, "drop": {"$setDifference": ["$ids", ["$keep"]]}}},
+    ]
+    drop = []
+    async for group in sessions.aggregate(pipeline, allowDiskUse=True):
+        drop.extend(group["drop"])
+    if drop:
+        res = await sessions.delete_many({"_id": {"$in": drop}})
+        ctx.incr("deleted", res.deleted_count)
+    return ctx.counters
+
+
+async def backfill_username_cf(db, ctx: MigrationContext) -> Dict[str, Any]:
+    # Mongo saknar "casefold", så $toLower används här. Det täcker 99% av fallen;
+    # nyinläggningar använder Python casefold() i register/login.
+    def update(user: Dict[str, Any]) -> Optional[UpdateOne]:
+        if not isinstance(user.get("username"), str):
+            return None
+        return UpdateOne(
+            {"_id": user["_id"], "username_cf": {"$exists": False}},
+            [{"$set": {"username_cf": {"$toLower": "$username"}}}],
+        )
+
+    await batched_update(db["users"], {"username_cf": {"$exists": False}}, {"_id": 1, "username": 1}, update, ctx)
+    return ctx.counters
+
+
+async def backfill_match_keys(db, ctx: MigrationContext) -> Dict[str, Any]:
+    def update(m: Dict[str, Any]) -> Optional[UpdateOne]:
+        dt = match_date(m.get("date"))
+        if dt is None or not m.get("home_team_id") or not m.get("away_team_id"):
+            return None
+        mk = build_match_key(m["home_team_id"], m["away_team_id"], dt)
+        return UpdateOne({"_id": m["_id"], "match_key": {"$exists": False}}, {"$set": {"match_key": mk}})
+
+    await batched_update(
+        db["matches"], {"match_key": {"$exists": False}},
+        {"_id": 1, "home_team_id": 1, "away_team_id": 1, "date": 1}, update, ctx,
+    )
+    return ctx.counters
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "sessions_dedupe", dedupe_sessions),
+    Migration(2, "username_cf_backfill", backfill_username_cf),
+    Migration(3, "match_key_backfill", backfill_match_keys),
+]
+LATEST_VERSION = max(m.version for m in MIGRATIONS)
+
+
+# ---- runner -----------------------------------------------------------------
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def _acquire_lock(collection, owner: str) -> bool:
+    now = datetime.utcnow()
+    try:
+        doc = await collection.find_one_and_update(
+            {"_id": SCHEMA_DOC, "$or": [{"lock": {"$exists": False}}, {"lock.expires_at": {"$lt": now}}]},
+            {"$set": {"lock": {"owner": owner, "expires_at": now + timedelta(seconds=MIGRATION_LOCK_TTL)}}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        return False  # schema-dokumentet finns och låset är upptaget
+    return bool(doc) and doc.get("lock", {}).get("owner") == owner
+
+
+async def _renew_lock(collection, owner: str) -> None:
+    await collection.update_one(
+        {"_id": SCHEMA_DOC, "lock.owner": owner},
+        {"$set": {"lock.expires_at": datetime.utcnow() + timedelta(seconds=MIGRATION_LOCK_TTL)}},
+    )
+
+
+async def schema_version(db) -> int:
+    doc = await db["migrations"].find_one({"_id": SCHEMA_DOC}, {"version": 1})
+    return int((doc or {}).get("version", 0))
+
+
+async def run_migrations(db, migrations: List[Migration] = MIGRATIONS) -> List[Dict[str, Any]]:
+    """
+    Run pending migrations. Returns one summary per migration run; empty when
+    the schema is current or another worker holds the lock.
+    """
+    collection = db["migrations"]
+    if await schema_version(db) >= LATEST_VERSION:
+        return []
+    owner = _owner()
+    if not await _acquire_lock(collection, owner):
+        logger.info("migrations: another worker holds the lock, skipping")
+        return []
+    summaries = []
+    try:
+        current = await schema_version(db)
+        for m in sorted(migrations, key=lambda m: m.version):
+            if m.version <= current:
+                continue
+            state = await collection.find_one({"_id": m.id}) or {}
+            ctx = MigrationContext(collection, m.id, owner, state.get("checkpoint"), state.get("counters"))
+            await collection.update_one(
+                {"_id": m.id},
+                {"$set": {"version": m.version, "name": m.name, "status": "running", "started_at": datetime.utcnow()},
+                 "$unset": {"error": ""}},
+                upsert=True,
+            )
+            t0 = time.monotonic()
+            try:
+                result = await m.fn(db, ctx)
+            except Exception as e:
+                await collection.update_one(
+                    {"_id": m.id},
+                    {"$set": {"status": "failed", "error": str(e), "counters": ctx.counters}},
+                )
+                raise
+            seconds = round(time.monotonic() - t0, 3)
+            await collection.update_one(
+                {"_id": m.id},
+                {"$set": {"status": "done", "finished_at": datetime.utcnow(), "seconds": seconds,
+                          "result": result, "counters": ctx.counters}},
+            )
+            await collection.update_one({"_id": SCHEMA_DOC}, {"$set": {"version": m.version}})
+            resumed = " (återupptagen)" if state.get("checkpoint") is not None else ""
+            print(f"[MIGRATION] {m.id}: {seconds:.2f}s {result}{resumed}")
+            summaries.append({"id": m.id, "seconds": seconds, "result": result})
+    finally:
+        await collection.update_one({"_id": SCHEMA_DOC, "lock.owner": owner}, {"$unset": {"lock": ""}})
+    return summaries
+
+
+async def _main(command: str) -> int:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL"))
+    db = client["speedway_elitserien"]
+    try:
+        if command == "run":
+            await run_migrations(db)
+        print(f"schema version {await schema_version(db)} / {LATEST_VERSION}")
+        async for doc in db["migrations"].find({"_id": {"$ne": SCHEMA_DOC}}).sort("version", 1):
+            print(f"  {doc['_id']:28} {doc.get('status', '?'):8} {doc.get('seconds', '-')}s {doc.get('counters', {})}")
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if cmd not in ("status", "run"):
+        print("usage: python -m services.migrations [status|run]")
+        sys.exit(2)
+    sys.exit(asyncio.run(_main(cmd)))
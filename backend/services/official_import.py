@@ -0,0 +1,179 @@
+# services/official_import.py
+"""
+Import of official matches (Flashscore) and heats (SVEMO) into Mongo.
+
+Körs av worker.py, som tar importjobben som admin-API:t köar. The
+scrapers – and with them Playwright, httpx and the HTML parsers – are only
+imported when an import actually runs, so importing this module is cheap.
+
+Pass a `services.jobs.JobProgress` as `progress` to report counters while
+an import runs.
+"""
+
+import hashlib
+import json
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from pymongo import UpdateOne
+
+
+class ScraperError(Exception):
+    """The scraper could not be imported or failed while running."""
+
+
+def heats_content_hash(heats: List[Dict[str, Any]]) -> str:
+    """Stabil hash av en tävlings heatdata – avgör om en omskrapning ändrat något."""
+    payload = json.dumps(heats, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _NoProgress:
+    def set(self, **values: Any) -> None:
+        pass
+
+    def incr(self, key: str, n: int = 1) -> None:
+        pass
+
+
+async def import_official_matches(official_matches_collection, progress=None) -> Dict[str, Any]:
+    """
+    All matches are upserted in one bulk write keyed on (home_team, away_team,
+    date); already known matches get their scores refreshed.
+    """
+    try:
+        from scraping.flashscore import fetch_official_speedway_matches_async  # type: ignore
+    except Exception as e:
+        raise ScraperError(f"Import error: {e}")
+    progress = progress or _NoProgress()
+    progress.set(phase="scraping")
+    try:
+        matches = await fetch_official_speedway_matches_async()
+    except Exception as e:
+        raise ScraperError(f"Scraper error: {e}")
+    progress.set(phase="upsert", fetched=len(matches))
+    # En bulk_write med upsert per match, nyckel (home_team, away_team, date).
+    # Kända matcher får uppdaterat resultat i stället för att hoppas över.
+    ops = []
+    for match in matches:
+        key = {"home_team": match["home_team"], "away_team": match["away_team"], "date": match["date"]}
+        # bara fält som kan ändras sätts – då räknas modified_count bara när resultatet ändrats
+        fields = {k: match[k] for k in ("source_url", "home_score", "away_score") if match.get(k) is not None}
+        update: Dict[str, Any] = {"$setOnInsert": {"id": match["id"], "scraped_at": match.get("scraped_at")}}
+        if fields:
+            update["$set"] = fields
+        ops.append(UpdateOne(key, update, upsert=True))
+    if not ops:
+        return {"imported_matches": 0, "updated_matches": 0, "fetched": 0}
+    res = await official_matches_collection.bulk_write(ops, ordered=False)
+    progress.set(phase="done", upserted=res.upserted_count, updated=res.modified_count)
+    return {
+        "imported_matches": res.upserted_count,
+        "updated_matches": res.modified_count,
+        "fetched": len(matches),
+    }
+
+
+async def known_competition_ids(official_heats_collection, force_refresh_days: int) -> Set[int]:
+    """competition_id för lagrade tävlingar som inte längre ska skrapas om."""
+    cutoff = datetime.utcnow() - timedelta(days=force_refresh_days)
+    query = {"$or": [
+        {"first_scraped_at": {"$lt": cutoff}},
+        # äldre dokument saknar first_scraped_at – använd scraped_at
+        {"first_scraped_at": {"$exists": False}, "scraped_at": {"$lt": cutoff}},
+    ]}
+    ids: Set[int] = set()
+    async for d in official_heats_collection.find(query, {"_id": 0, "competition_id": 1}):
+        if d.get("competition_id") is not None:
+            ids.add(d["competition_id"])
+    return ids
+
+
+async def import_official_heats(
+    official_heats_collection,
+    force_refresh_days: int = 7,
+    full: bool = False,
+    progress=None,
+) -> Dict[str, Any]:
+    """
+    Competitions are upserted in one bulk write keyed on competition_id; a
+    content hash per competition means unchanged ones are skipped
+    ("duplicates") and late corrections are updated in place ("updated").
+
+    Competitions already stored are not scraped again unless they were first
+    seen within the last `force_refresh_days` days; `full` re-scrapes
+    everything.
+    """
+    try:
+        from scraping.svemo import fetch_all_svemo_heats  # type: ignore
+    except Exception as e:
+        raise ScraperError(f"Import error: {e}")
+    progress = progress or _NoProgress()
+    known_ids = set() if full else await known_competition_ids(official_heats_collection, force_refresh_days)
+    progress.set(phase="scraping", known_competitions=len(known_ids), pages_scraped=0)
+    try:
+        heats_data = await fetch_all_svemo_heats(
+            known_ids=known_ids, on_item=lambda _: progress.incr("pages_scraped")
+        )
+    except Exception as e:
+        raise ScraperError(f"Scraper error: {e}")
+    progress.set(phase="upsert")
+    skipped_no_comp = 0
+    total_processed = 0
+    latest: Dict[Any, Dict[str, Any]] = {}
+    for heat_doc in heats_data:
+        total_processed += 1
+        comp_id = heat_doc.get("competition_id")
+        if not comp_id:
+            skipped_no_comp += 1
+            continue
+        latest[comp_id] = heat_doc  # dubbletter i samma körning: sista vinner
+
+    # Ett $in-uppslag för befintliga hashar i stället för find_one per tävling
+    known: Dict[Any, Optional[str]] = {}
+    if latest:
+        async for d in official_heats_collection.find(
+            {"competition_id": {"$in": list(latest)}}, {"_id": 0, "competition_id": 1, "content_hash": 1}
+        ):
+            known[d["competition_id"]] = d.get("content_hash")
+
+    ops = []
+    added = updated = unchanged = 0
+    for comp_id, heat_doc in latest.items():
+        content_hash = heats_content_hash(heat_doc.get("heats") or [])
+        if comp_id in known:
+            if known[comp_id] == content_hash:
+                unchanged += 1
+                continue
+            updated += 1
+        else:
+            added += 1
+        ops.append(UpdateOne(
+            {"competition_id": comp_id},
+            {
+                "$set": {
+                    "heats": heat_doc.get("heats") or [],
+                    "source_url": heat_doc.get("source_url"),
+                    "scraped_at": heat_doc.get("scraped_at"),
+                    "content_hash": content_hash,
+                },
+                "$setOnInsert": {
+                    "id": heat_doc.get("id") or str(uuid.uuid4()),
+                    "first_scraped_at": heat_doc.get("scraped_at") or datetime.utcnow(),
+                },
+            },
+            upsert=True,
+        ))
+    if ops:
+        await official_heats_collection.bulk_write(ops, ordered=False)
+    progress.set(phase="done", upserted=added, updated=updated, unchanged=unchanged)
+    return {
+        "message": f"{added} heatmatcher importerade",
+        "fetched": len(heats_data),
+        "skipped_no_competition_id": skipped_no_comp,
+        "duplicates": unchanged,
+        "updated": updated,
+        "total_processed": total_processed,
+        "known_competitions": len(known_ids),
+    }
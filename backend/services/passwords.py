@@ -0,0 +1,84 @@
+# services/passwords.py
+"""
+Async bcrypt helpers backed by a small, bounded thread pool.
+
+bcrypt.hashpw/checkpw tar 100–300 ms och skulle annars blockera event-loopen.
+The pool has a fixed number of threads and a cap on queued + running jobs;
+when the cap is reached new calls fail fast with HTTP 503 instead of piling
+up behind each other.
+"""
+
+import asyncio
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", "32"))
+
+_COST_RE = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_pending = 0
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="bcrypt")
+    return _executor
+
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    """Hash a plaintext password using bcrypt (blocking)."""
+    import bcrypt  # laddas vid första login/registrering, inte vid uppstart
+
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    """Verify a plaintext password against a bcrypt hash (blocking)."""
+    import bcrypt
+
+    return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+def hash_cost(hashed: str) -> Optional[int]:
+    m = _COST_RE.match(hashed or "")
+    return int(m.group(1)) if m else None
+
+
+def needs_rehash(hashed: str, rounds: int = BCRYPT_ROUNDS) -> bool:
+    """True if the stored hash was made with another cost than the configured one."""
+    return hash_cost(hashed) != rounds
+
+
+async def _run(fn, *args):
+    global _pending
+    if _pending >= PASSWORD_MAX_PENDING:
+        raise HTTPException(status_code=503, detail="Servern är hårt belastad, försök igen om en stund")
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run(hash_password, password)
+
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await _run(verify_password, password, hashed)
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
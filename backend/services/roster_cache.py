@@ -0,0 +1,72 @@
+# services/roster_cache.py
+"""
+Process-wide roster cache keyed by team_id.
+
+Heat-generering, validering av byten och nomineringar behöver alla samma
+trupp. Each entry holds the mains/reserves split used by heat generation and
+an id -> rider map used by validation; both come from one `riders` query
+per team. Entries are loaded lazily, expire after `ttl` seconds (so changes
+made by another worker show up eventually) and are dropped explicitly by
+seeding and the admin sync endpoints.
+
+The returned lists/dicts are shared – treat them as read-only.
+"""
+
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+ROSTER_CACHE_TTL = float(os.getenv("ROSTER_CACHE_TTL", "300"))
+
+
+def _roster_item(r: Dict[str, Any]) -> Dict[str, Any]:
+    # finns både "number" och ev. "lineup_no" i DB – normalisera
+    lineup_no = r.get("lineup_no") or r.get("number") or None
+    return {
+        "id": str(r["id"]),
+        "name": r.get("name", ""),
+        "lineup_no": int(lineup_no) if lineup_no is not None else None,
+        "is_reserve": bool(r.get("is_reserve", False)),
+    }
+
+
+class RosterEntry:
+    __slots__ = ("mains", "reserves", "by_id")
+
+    def __init__(self, riders: List[Dict[str, Any]]) -> None:
+        self.by_id: Dict[str, Dict[str, Any]] = {str(r["id"]): r for r in riders}
+        self.mains: List[Dict[str, Any]] = []
+        self.reserves: List[Dict[str, Any]] = []
+        for r in riders:
+            item = _roster_item(r)
+            (self.reserves if item["is_reserve"] else self.mains).append(item)
+        # sortera på lineup_no om möjligt
+        self.mains.sort(key=lambda x: (x["lineup_no"] is None, x["lineup_no"]))
+        self.reserves.sort(key=lambda x: (x["lineup_no"] is None, x["lineup_no"]))
+
+    def split(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {"mains": self.mains, "reserves": self.reserves}
+
+
+class RosterCache:
+    def __init__(self, ttl: float = ROSTER_CACHE_TTL) -> None:
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, RosterEntry]] = {}
+
+    async def get(self, team_id: str, riders_collection) -> RosterEntry:
+        hit = self._entries.get(team_id)
+        if hit and hit[0] >= time.monotonic():
+            return hit[1]
+        riders = await riders_collection.find({"team_id": team_id}, {"_id": 0}).to_list(length=None)
+        entry = RosterEntry(riders)
+        self._entries[team_id] = (time.monotonic() + self.ttl, entry)
+        return entry
+
+    def invalidate(self, team_id: Optional[str] = None) -> None:
+        if team_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(team_id, None)
+
+
+roster_cache = RosterCache()
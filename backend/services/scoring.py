@@ -0,0 +1,112 @@
+#services/scoring.py
+"""
+Heat scoring for Elitserien protocols.
+
+Varje heat lagrar sitt eget lagbidrag i `heat["points"] = {"home": x, "away": y}`.
+Match totals are the sum of those per-heat contributions, so re-saving a
+heat only applies the difference against what that heat contributed before.
+"""
+
+from typing import Any, Dict, List, Tuple
+
+# Standard 3‑2‑1‑0
+POINTS_MAP = {1: 3, 2: 2, 3: 1, 4: 0}
+
+
+def _rider_team_map(heat: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        e.get("rider_id"): e.get("team")
+        for e in (heat.get("riders") or {}).values()
+        if e and e.get("rider_id")
+    }
+
+
+def score_heat(heat: Dict[str, Any], results: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Score raw results for one heat.
+
+    Returns (scored_results, {"home": pts, "away": pts}). Bonus points go to
+    the rider finishing second in a 5‑1 or third in a 3‑3 heat; they are
+    stored per rider but do not count towards the team totals.
+    """
+    rider_team = _rider_team_map(heat)
+    scored: List[Dict[str, Any]] = []
+    totals = {"home": 0, "away": 0}
+    for result in results:
+        pos = result.get("position", 0)
+        status = result.get("status", "completed")
+        pts = POINTS_MAP.get(pos, 0) if status == "completed" else 0
+        scored.append({
+            "rider_id": result["rider_id"],
+            "position": pos,
+            "points": pts,
+            "status": status,
+        })
+        team = rider_team.get(result["rider_id"])
+        if team in totals:
+            totals[team] += pts
+
+    ordered = sorted(scored, key=lambda r: r.get("position", 0))
+    if len(ordered) == 4:
+        t1, t2, t3 = (rider_team.get(r["rider_id"]) for r in ordered[:3])
+        if t1 == t2:
+            ordered[1]["bonus_points"] = 1
+        elif t2 == t3:
+            ordered[2]["bonus_points"] = 1
+    for res in scored:
+        res.setdefault("bonus_points", 0)
+    return scored, totals
+
+
+def heat_points(heat: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    Team contribution of one heat. Uses the stored `points` when present and
+    falls back to summing results for heats saved before it existed.
+    """
+    stored = heat.get("points")
+    if isinstance(stored, dict):
+        return int(stored.get("home", 0)), int(stored.get("away", 0))
+    results = heat.get("results") or []
+    if not results:
+        return 0, 0
+    rider_team = _rider_team_map(heat)
+    home = away = 0
+    for res in results:
+        team = rider_team.get(res.get("rider_id"))
+        pts = int(res.get("points", 0))
+        if team == "home":
+            home += pts
+        elif team == "away":
+            away += pts
+    return home, away
+
+
+def has_stored_points(heats: List[Dict[str, Any]]) -> bool:
+    """False if any scored heat predates per-heat contributions (legacy docs)."""
+    return all(isinstance(h.get("points"), dict) or not h.get("results") for h in heats)
+
+
+def missing_points(heats: List[Dict[str, Any]]) -> Dict[int, Dict[str, int]]:
+    """Array index -> computed `points` for scored heats that lack stored points."""
+    missing = {}
+    for i, h in enumerate(heats):
+        if h.get("results") and not isinstance(h.get("points"), dict):
+            home, away = heat_points(h)
+            missing[i] = {"home": home, "away": away}
+    return missing
+
+
+def team_scores_upto(heats: List[Dict[str, Any]], upto_heat: int) -> Tuple[int, int]:
+    home = away = 0
+    for h in heats:
+        hn = h.get("heat_number")
+        if not isinstance(hn, int) or hn >= upto_heat:
+            continue
+        hp, ap = heat_points(h)
+        home += hp
+        away += ap
+    return home, away
+
+
+def match_totals(heats: List[Dict[str, Any]]) -> Tuple[int, int]:
+    return team_scores_upto(heats, upto_heat=10**6)
@@ -0,0 +1,164 @@
+# services/session_cache.py
+"""
+In-process cache for session validation used by `verify_jwt_token`.
+
+Varje autentiserad request slår annars mot `sessions` två gånger (find_one +
+update_one för last_active). Cachen håller giltiga sessioner per
+(user_id, jti) en kort stund och samlar last_active-skrivningar så att de
+flushas i batchar av en bakgrundstask i stället för en gång per request.
+
+The TTL is deliberately short: other workers may delete a session, and the
+cache only guarantees that a revoked session stops working within `ttl`
+seconds there. Routes in this process that delete sessions call
+`invalidate` / `invalidate_user` so the effect is immediate locally.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger("uvicorn.error")
+
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "30"))
+LAST_ACTIVE_INTERVAL = float(os.getenv("SESSION_LAST_ACTIVE_INTERVAL", "60"))
+SESSION_CACHE_MAX = int(os.getenv("SESSION_CACHE_MAX", "10000"))
+
+Key = Tuple[str, str]
+
+
+class SessionCache:
+    """
+    TTL-cache för sessioner + write-behind för last_active.
+
+    Only the fields needed to validate a request are cached (`_id` and
+    `fingerprint`). `touch()` records the latest activity per session and
+    `flush()` writes at most one `last_active` per session per interval.
+    """
+
+    def __init__(self, ttl: float = SESSION_CACHE_TTL, touch_interval: float = LAST_ACTIVE_INTERVAL,
+                 max_entries: int = SESSION_CACHE_MAX) -> None:
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self.max_entries = max_entries
+        self._entries: Dict[Key, Tuple[float, Dict[str, Any]]] = {}
+        # _id -> senaste aktivitet som ännu inte skrivits
+        self._pending: Dict[Any, datetime] = {}
+        # _id -> monotonic tid för senaste skrivning
+        self._written: Dict[Any, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    # ---- validation cache -------------------------------------------------
+
+    def get(self, user_id: str, jti: str) -> Optional[Dict[str, Any]]:
+        hit = self._entries.get((user_id, jti))
+        if not hit:
+            return None
+        expires, sess = hit
+        if expires < time.monotonic():
+            self._entries.pop((user_id, jti), None)
+            return None
+        return sess
+
+    def put(self, user_id: str, jti: str, sess: Dict[str, Any]) -> None:
+        if len(self._entries) >= self.max_entries:
+            self._evict_expired()
+            if len(self._entries) >= self.max_entries:
+                # fortfarande fullt: släng äldsta insatta posten
+                self._entries.pop(next(iter(self._entries)), None)
+        self._entries[(user_id, jti)] = (
+            time.monotonic() + self.ttl,
+            {"_id": sess.get("_id"), "fingerprint": sess.get("fingerprint")},
+        )
+
+    def invalidate(self, user_id: str, jti: str) -> None:
+        hit = self._entries.pop((user_id, jti), None)
+        if hit:
+            self._forget(hit[1].get("_id"))
+
+    def invalidate_user(self, user_id: str) -> None:
+        for key in [k for k in self._entries if k[0] == user_id]:
+            self.invalidate(*key)
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, (exp, _) in self._entries.items() if exp < now]:
+            self._entries.pop(key, None)
+
+    def _forget(self, oid: Any) -> None:
+        # en raderad session ska inte återuppstå via en sen last_active-flush
+        self._pending.pop(oid, None)
+        self._written.pop(oid, None)
+
+    # ---- write-behind last_active ----------------------------------------
+
+    def touch(self, oid: Any, when: Optional[datetime] = None) -> None:
+        self._pending[oid] = when or datetime.utcnow()
+
+    def mark_written(self, oid: Any) -> None:
+        """Call after a route wrote last_active itself (login/register)."""
+        self._pending.pop(oid, None)
+        self._written[oid] = time.monotonic()
+
+    async def flush(self, collection, force: bool = False) -> int:
+        if not self._pending or collection is None:
+            return 0
+        now = time.monotonic()
+        due = [
+            oid for oid in self._pending
+            if force or now - self._written.get(oid, 0.0) >= self.touch_interval
+        ]
+        if not due:
+            return 0
+        batch = {oid: self._pending[oid] for oid in due}
+        # $max så att en äldre tidsstämpel aldrig skriver över en nyare
+        ops = [UpdateOne({"_id": oid}, {"$max": {"last_active": ts}}) for oid, ts in batch.items()]
+        # State ändras först när skrivningen lyckats – annars ligger posterna
+        # kvar i _pending och tas med i nästa flush.
+        await collection.bulk_write(ops, ordered=False)
+        for oid, ts in batch.items():
+            if self._pending.get(oid) == ts:  # en nyare touch under await ska ligga kvar
+                del self._pending[oid]
+            self._written[oid] = now
+        # håll _written begränsad: poster äldre än intervallet behövs inte
+        for oid in [o for o, t in self._written.items() if now - t > self.touch_interval * 2]:
+            self._written.pop(oid, None)
+        return len(ops)
+
+    def start(self, get_collection) -> None:
+        """Start the background flusher. `get_collection` returns the sessions collection."""
+        if self._task and not self._task.done():
+            return
+
+        async def _loop() -> None:
+            interval = max(1.0, min(self.touch_interval, 15.0))
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.flush(get_collection())
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("session last_active flush failed: %s", e)
+
+        self._task = asyncio.create_task(_loop())
+
+    async def stop(self, collection) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush(collection, force=True)
+        except Exception as e:
+            logger.warning("final session last_active flush failed: %s", e)
+
+
+session_cache = SessionCache()
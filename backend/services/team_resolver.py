@@ -0,0 +1,151 @@
+# services/team_resolver.py
+"""
+Team name resolver for scraped team names.
+
+Indexet byggs en gång från teams-collectionen (och byggs om när lag ändras
+eller efter `ttl` sekunder): exakta namn- och namn+stad-varianter, alias,
+samt ett inverterat token-index för fuzzy-matchningen. Lookups are dict
+probes plus a Jaccard scan limited to keys sharing a token with the query,
+and previously seen names are memoized – no database I/O on the hot path.
+"""
+
+import os
+import time
+from typing import Any, Dict, List, Optional, Set
+
+TEAM_RESOLVER_TTL = float(os.getenv("TEAM_RESOLVER_TTL", "300"))
+
+CITY_SUFFIXES = {
+    "målilla","malilla","hallstavik","motala","gislaved",
+    "eskilstuna","norrköping","norrkoping","kumla","västervik","vastervik"
+}
+
+TEAM_ALIASES = {
+    # normaliserade strängar -> kanoniskt teamnamn (normaliserat)
+    "dackarna målilla": "dackarna",
+    "dackarna malilla": "dackarna",
+    "rospiggarna hallstavik": "rospiggarna",
+    "piraterna motala": "piraterna",
+    "lejonen gislaved": "lejonen",
+    "smederna eskilstuna": "smederna",
+    "vargarna norrköping": "vargarna",
+    "vargarna norrkoping": "vargarna",
+    "västervik västervik": "västervik",
+    "vastervik vastervik": "västervik",
+    # vanliga varianter
+    "dackarna": "dackarna",
+    "lejonen": "lejonen",
+    "piraterna": "piraterna",
+    "rospiggarna": "rospiggarna",
+    "smederna": "smederna",
+    "vargarna": "vargarna",
+    "västervik": "västervik",
+    "vastervik": "västervik",
+    "indianerna": "indianerna",
+}
+
+def _norm(s: str) -> List[str]:
+    return (
+        (s or "").lower()
+        .encode("utf-8", "ignore")
+        .decode("utf-8")
+        .replace("å","a").replace("ä","a").replace("ö","o")
+        .split()
+    )
+
+def _normalize_join(s: str) -> str:
+    return " ".join(_norm(s))
+
+def _strip_city_suffix(name: str) -> str:
+    toks = _norm(name)
+    if toks and toks[-1] in CITY_SUFFIXES:
+        toks = toks[:-1]
+    return " ".join(toks)
+
+
+class TeamResolver:
+    def __init__(self, ttl: float = TEAM_RESOLVER_TTL, memo_max: int = 2048) -> None:
+        self.ttl = ttl
+        self.memo_max = memo_max
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._aliases: Dict[str, Dict[str, Any]] = {}
+        self._key_tokens: Dict[str, Set[str]] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        self._memo: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._expires = 0.0
+
+    def build(self, teams: List[Dict[str, Any]]) -> None:
+        """
+        { normalized_name: team_doc } där normalized_name är både 'namn' och
+        'namn+stad', plus alias som pekar på ett lag som finns.
+        """
+        index: Dict[str, Dict[str, Any]] = {}
+        for t in teams:
+            index[_normalize_join(t["name"])] = t
+            if t.get("city"):
+                index[_normalize_join(f"{t['name']} {t['city']}")] = t
+        self._index = index
+        self._aliases = {a: index[c] for a, c in TEAM_ALIASES.items() if c in index}
+        self._key_tokens = {k: set(k.split()) for k in index}
+        postings: Dict[str, Set[str]] = {}
+        for key, toks in self._key_tokens.items():
+            for tok in toks:
+                postings.setdefault(tok, set()).add(key)
+        self._postings = postings
+        self._memo = {}
+        self._expires = time.monotonic() + self.ttl
+
+    async def ensure(self, teams_collection) -> None:
+        if time.monotonic() < self._expires:
+            return
+        teams = await teams_collection.find({}, {"_id": 0}).to_list(length=None)
+        self.build(teams)
+
+    def invalidate(self) -> None:
+        self._expires = 0.0
+
+    def _probe(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._index.get(key) or self._aliases.get(key)
+
+    def resolve(self, scraped_name: str) -> Optional[Dict[str, Any]]:
+        if scraped_name in self._memo:
+            return self._memo[scraped_name]
+        team = self._resolve(scraped_name)
+        if len(self._memo) >= self.memo_max:
+            self._memo.clear()
+        self._memo[scraped_name] = team
+        return team
+
+    def _resolve(self, scraped_name: str) -> Optional[Dict[str, Any]]:
+        n = _normalize_join(scraped_name)
+        # exakt normaliserad träff, sedan alias
+        team = self._probe(n)
+        if team:
+            return team
+        # ta bort stadssuffix
+        team = self._probe(_strip_city_suffix(scraped_name))
+        if team:
+            return team
+        # prova första ordet (t.ex. "Dackarna Malilla" -> "dackarna")
+        first = n.split(" ")[0] if n else ""
+        team = self._probe(first)
+        if team:
+            return team
+
+        # enkel fuzzy som sista steg – bara nycklar som delar minst ett token
+        query = set(n.split())
+        candidates: Set[str] = set()
+        for tok in query:
+            candidates |= self._postings.get(tok, set())
+        best_key, best_score = None, 0.0
+        for key in sorted(candidates):
+            toks = self._key_tokens[key]
+            sc = len(query & toks) / len(query | toks)
+            if sc > best_score:
+                best_key, best_score = key, sc
+        if best_key and best_score >= 0.6:
+            return self._index[best_key]
+        return None
+
+
+team_resolver = TeamResolver()
@@ -0,0 +1,81 @@
+"""
+Import-time report for the API process.
+
+    python startup_bench.py [--module server_async] [--top 25] [--json out.json]
+
+Kör `python -X importtime -c "import <module>"` i en ny process och summerar
+stderr-raderna: total import time, the slowest top-level packages
+(cumulative) and whether any module that belongs in the scraper worker was
+loaded. Exit code 1 if one was, so the check can run in CI next to the
+recorded numbers.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# Ska bara laddas av worker.py, aldrig av API-processen
+WORKER_ONLY = ("playwright", "bs4", "lxml", "selectolax", "httpx", "scraping")
+
+
+def importtime(module: str) -> List[Tuple[str, int, int]]:
+    """(module, self_us, cumulative_us) per imported module, in import order."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=Path(__file__).parent,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr.strip().splitlines()[-1] if proc.stderr else "import failed")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        # namnet behåller indraget (2 blanksteg per nivå) efter separatorns blanksteg
+        rows.append((name[1:].rstrip(), int(self_us), int(cum_us)))
+    return rows
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python startup_bench.py")
+    ap.add_argument("--module", default="server_async")
+    ap.add_argument("--top", type=int, default=25)
+    ap.add_argument("--json", type=Path, help="skriv rapporten som JSON (för att spåra över tid)")
+    args = ap.parse_args(argv)
+
+    rows = importtime(args.module)
+    # top-level paket = rader utan indrag
+    top_level: Dict[str, int] = {}
+    for name, _, cum in rows:
+        if not name.startswith(" "):
+            top_level[name] = max(top_level.get(name, 0), cum)
+    total_us = sum(top_level.values())
+    loaded = {name.strip() for name, _, _ in rows}
+    offenders = sorted(m for m in loaded if m.split(".")[0] in WORKER_ONLY)
+
+    print(f"import {args.module}: {total_us / 1000:.1f} ms, {len(loaded)} moduler")
+    print(f"{'paket':40} {'kumulativt ms':>14}")
+    for name, cum in sorted(top_level.items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+        print(f"{name:40} {cum / 1000:14.1f}")
+    if offenders:
+        print(f"\n[FAIL] worker-moduler laddade vid uppstart: {', '.join(offenders)}")
+
+    if args.json:
+        args.json.write_text(json.dumps({
+            "module": args.module,
+            "total_ms": round(total_us / 1000, 1),
+            "modules": len(loaded),
+            "top": {name: round(cum / 1000, 1) for name, cum in
+                    sorted(top_level.items(), key=lambda kv: kv[1], reverse=True)[:args.top]},
+            "worker_only_loaded": offenders,
+        }, indent=2), encoding="utf-8")
+    return 1 if offenders else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
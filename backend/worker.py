@@ -0,0 +1,92 @@
+"""
+Worker entry point for scraper imports.
+
+Kör importerna utanför API-processen så att webbworkers inte behöver
+Playwright, httpx eller HTML-parsers installerade (se requirements-scraper.txt).
+The API only queues import jobs in the `jobs` collection; this process runs
+them:
+
+    python worker.py run [--once]     # kör köade importjobb (långlivad process)
+    python worker.py matches          # köa + kör en import direkt
+    python worker.py heats [--force-refresh-days 7] [--full]
+
+`matches`/`heats` go through the same job queue, so they never run at the
+same time as an import of the same kind started from the admin API.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from typing import Any, Dict
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from services import official_import
+from services.jobs import job_runner
+
+MATCHES_JOB = "import-official-matches"
+HEATS_JOB = "import-official-heats"
+
+
+def _register(db) -> None:
+    async def import_matches(params: Dict[str, Any], progress) -> Dict[str, Any]:
+        return await official_import.import_official_matches(db["official_matches"], progress=progress)
+
+    async def import_heats(params: Dict[str, Any], progress) -> Dict[str, Any]:
+        return await official_import.import_official_heats(
+            db["official_heats"],
+            force_refresh_days=params.get("force_refresh_days", 7),
+            full=params.get("full", False),
+            progress=progress,
+        )
+
+    job_runner.register(MATCHES_JOB, import_matches)
+    job_runner.register(HEATS_JOB, import_heats)
+
+
+async def _run(args: argparse.Namespace) -> Dict[str, Any]:
+    client = AsyncIOMotorClient(os.getenv("MONGO_URL"))
+    db = client["speedway_elitserien"]
+    _register(db)
+    try:
+        # köade jobb plockas bara av `run`; matches/heats kör enbart sitt eget jobb
+        await job_runner.init(db["jobs"], resume=args.command == "run")
+        if args.command == "run":
+            await job_runner.work(once=args.once)
+            return {"status": "idle"}
+        if args.command == "matches":
+            kind, params = MATCHES_JOB, {}
+        else:
+            kind, params = HEATS_JOB, {"force_refresh_days": args.force_refresh_days, "full": args.full}
+        job, created = await job_runner.enqueue(kind, params)
+        if not created:
+            return {**job, "already_running": True}
+        return await job_runner.wait(job["id"]) or job
+    finally:
+        await job_runner.stop()
+        client.close()
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python worker.py")
+    sub = ap.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="kör köade importjobb från `jobs`")
+    run.add_argument("--once", action="store_true", help="avsluta när kön är tom")
+    sub.add_parser("matches", help="importera officiella matcher (Flashscore)")
+    heats = sub.add_parser("heats", help="importera officiella heat (SVEMO)")
+    heats.add_argument("--force-refresh-days", type=int, default=7)
+    heats.add_argument("--full", action="store_true", help="skrapa om alla tävlingar")
+
+    args = ap.parse_args(argv)
+    result = asyncio.run(_run(args))
+    print(json.dumps(result, ensure_ascii=False, default=str))
+    if result.get("already_running"):
+        print(f"[ERROR] ett {result['kind']}-jobb är redan aktivt ({result['id']})", file=sys.stderr)
+        return 1
+    return 1 if result.get("status") == "failed" else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
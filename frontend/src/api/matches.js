@@ -36,15 +36,22 @@ export const confirmMatch = (id) =>
   apiCall(`/api/matches/${id}/confirm`, { method: "PUT" });
 
 // ---- Heat results & riders ----
-export const clearHeatResults = (matchId, heatNumber) =>
+// `version` kommer från GET /api/matches/:id (och från varje skrivsvar).
+// Servern svarar 409 om protokollet ändrats sedan dess, t.ex. i en annan flik.
+export const ifMatch = (version) =>
+  version == null ? {} : { "If-Match": String(version) };
+
+export const clearHeatResults = (matchId, heatNumber, version) =>
   apiCall(`/api/matches/${matchId}/heat/${heatNumber}/result`, {
     method: "PUT",
+    headers: ifMatch(version),
     body: JSON.stringify({ results: [] }),
   });
 
-export const putHeatResults = (matchId, heatNumber, results) =>
+export const putHeatResults = (matchId, heatNumber, results, version) =>
   apiCall(`/api/matches/${matchId}/heat/${heatNumber}/result`, {
     method: "PUT",
+    headers: ifMatch(version),
     body: JSON.stringify({ results }),
   });
 
@@ -69,9 +76,10 @@ export const putHeatResults = (matchId, heatNumber, results) =>
 //   });
 // };
 
-export const updateHeatRiders = (matchId, heatNumber, assignments) =>
+export const updateHeatRiders = (matchId, heatNumber, assignments, version) =>
   apiCall(`/api/matches/${matchId}/heat/${heatNumber}/riders`, {
     method: "PUT",
+    headers: ifMatch(version),
     body: JSON.stringify(assignments),
   });
 
@@ -70,7 +70,7 @@ export default function MatchList({ matches, userId, onDelete }) {
               <Play className="w-4 h-4 mr-0 sm:mr-2" />
               {/* Text göms på små skärmar, visas på sm+ */}
               <span className="hidden sm:inline">
-                {match.heats.some((h) => h.results?.length > 0)
+                {(match.has_results ?? match.heats?.some((h) => h.results?.length > 0))
                   ? "Återuppta protokoll"
                   : "Starta protokoll"}
               </span>
@@ -4,6 +4,7 @@ import { Dialog, DialogContent, DialogHeader, DialogTitle } from "./ui/dialog";
 import { Button } from "./ui/button";
 import { Badge } from "./ui/badge";
 import { apiCall } from "@/api/client";
+import { ifMatch } from "@/api/matches";
 
 /**
  * Props:
@@ -196,6 +197,7 @@ export default function NominationDialog({ open, onClose, match, onSaved }) {
       }
       await apiCall(`/api/matches/${match.id}/nominations`, {
         method: "PUT",
+        headers: ifMatch(match.version),
         body: JSON.stringify(body),
       });
       onSaved?.();
@@ -132,29 +132,48 @@ export default function MatchProtocolPage() {
       }
       if (!match?.id || !heat_number) return;
 
-      // 1) Byten (om några)
-      if (assignments && Object.keys(assignments).length > 0) {
-        await setRiders.mutateAsync({
+      // Versionen vi laddade skickas som If-Match; varje svar ger nästa version
+      let version = match.version;
+      try {
+        // 1) Byten (om några)
+        if (assignments && Object.keys(assignments).length > 0) {
+          const res = await setRiders.mutateAsync({
+            matchId: match.id,
+            heatNumber: heat_number,
+            assignments,
+            version,
+          });
+          version = res?.version ?? version;
+        }
+
+        // 2) Nollställ resultat
+        const cleared = await clearHeat.mutateAsync({
           matchId: match.id,
           heatNumber: heat_number,
-          assignments,
+          version,
         });
-      }
-
-      // 2) Nollställ resultat
-      await clearHeat.mutateAsync({ matchId: match.id, heatNumber: heat_number });
+        version = cleared?.version ?? version;
 
-      // 3) Skriv nya resultat
-      await putResults.mutateAsync({
-        matchId: match.id,
-        heatNumber: heat_number,
-        results,
-      });
+        // 3) Skriv nya resultat
+        await putResults.mutateAsync({
+          matchId: match.id,
+          heatNumber: heat_number,
+          results,
+          version,
+        });
+      } catch (e) {
+        if (e?.status === 409) {
+          // ändrat i en annan flik: visa den sparade versionen i stället
+          toast.error(e.message || "Protokollet har ändrats i en annan flik – ladda om");
+          await refetch();
+        }
+        throw e;
+      }
 
       // 4) Hämta om via TanStack
       await refetch();
     },
-    [match?.id, setRiders, clearHeat, putResults, refetch]
+    [match?.id, match?.version, setRiders, clearHeat, putResults, refetch]
   );
 
   // Spara/confirm protokoll
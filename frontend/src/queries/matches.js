@@ -138,7 +138,8 @@ export function useResolveUserMatch() {
 export function useClearHeatResults() {
   const qc = useQueryClient();
   return useMutation({
-    mutationFn: ({ matchId, heatNumber }) => clearHeatResults(matchId, heatNumber),
+    mutationFn: ({ matchId, heatNumber, version }) =>
+      clearHeatResults(matchId, heatNumber, version),
     onSuccess: (_data, { matchId }) => {
       qc.invalidateQueries({ queryKey: qk.match(matchId) });
       qc.invalidateQueries({ queryKey: qk.matches });
@@ -150,8 +151,8 @@ export function useClearHeatResults() {
 export function usePutHeatResults() {
   const qc = useQueryClient();
   return useMutation({
-    mutationFn: ({ matchId, heatNumber, results }) =>
-      putHeatResults(matchId, heatNumber, results),
+    mutationFn: ({ matchId, heatNumber, results, version }) =>
+      putHeatResults(matchId, heatNumber, results, version),
     onSuccess: (_data, { matchId }) => {
       qc.invalidateQueries({ queryKey: qk.match(matchId) });
       qc.invalidateQueries({ queryKey: qk.matches });
@@ -163,8 +164,8 @@ export function usePutHeatResults() {
 export function useUpdateHeatRiders() {
   const qc = useQueryClient();
   return useMutation({
-    mutationFn: ({ matchId, heatNumber, assignments }) =>
-      updateHeatRiders(matchId, heatNumber, assignments),
+    mutationFn: ({ matchId, heatNumber, assignments, version }) =>
+      updateHeatRiders(matchId, heatNumber, assignments, version),
     onSuccess: (_data, { matchId }) => {
       qc.invalidateQueries({ queryKey: qk.match(matchId) });
       qc.invalidateQueries({ queryKey: qk.matches });
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# backend-modulerna importeras som `services.*` (samma som när servern körs från backend/)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
@@ -0,0 +1,36 @@
+"""
+explain()-check of every endpoint query shape in services.indexes.QUERY_SHAPES.
+
+Kräver en riktig MongoDB: sätt MONGO_URL. Indexen skapas i en separat
+testdatabas (MONGO_TEST_DB) som tas bort efteråt.
+"""
+
+import asyncio
+import os
+
+import pytest
+
+MONGO_URL = os.getenv("MONGO_URL")
+
+pytestmark = pytest.mark.skipif(not MONGO_URL, reason="MONGO_URL är inte satt")
+
+
+def test_every_endpoint_query_is_index_covered():
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from services.indexes import QUERY_SHAPES, apply_indexes, check_queries
+
+    async def run():
+        client = AsyncIOMotorClient(MONGO_URL)
+        name = os.getenv("MONGO_TEST_DB", "speedway_elitserien_test_indexes")
+        db = client[name]
+        try:
+            result = await apply_indexes(db)
+            assert not result["failed"] and not result["conflicts"], result
+            return await check_queries(db, QUERY_SHAPES)
+        finally:
+            await client.drop_database(name)
+            client.close()
+
+    failures = asyncio.run(run())
+    assert failures == [], "collection scans:\n" + "\n".join(failures)
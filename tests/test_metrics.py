@@ -0,0 +1,67 @@
+"""Prometheus text exposition of services.metrics (Counter/Histogram.render)."""
+
+import re
+
+from services.metrics import Counter, Histogram, render
+
+LINE = re.compile(r'^(?P<name>[a-z_]+)\{(?P<labels>.*)\} (?P<value>\S+)$')
+
+
+def _samples(lines):
+    out = []
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        m = LINE.match(line)
+        assert m, line
+        labels = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', m["labels"]))
+        out.append((m["name"], labels, float(m["value"])))
+    return out
+
+
+def _histogram(values, buckets=(0.1, 0.5, 1.0)):
+    h = Histogram("t_seconds", "test", ("route",), buckets)
+    for v in values:
+        h.observe(("/r",), v)
+    return h, _samples(h.render())
+
+
+def test_histogram_buckets_are_cumulative():
+    _, samples = _histogram([0.05, 0.2, 0.3, 0.7, 3.0])
+    buckets = [(s[1]["le"], s[2]) for s in samples if s[0] == "t_seconds_bucket"]
+    assert buckets == [("0.1", 1), ("0.5", 3), ("1", 4), ("+Inf", 5)]
+    counts = [v for _, v in buckets]
+    assert counts == sorted(counts)
+
+
+def test_histogram_inf_bucket_equals_count_and_sum_is_total():
+    _, samples = _histogram([0.05, 0.2, 7.5])
+    by_name = {(name, labels.get("le")): value for name, labels, value in samples}
+    assert by_name[("t_seconds_bucket", "+Inf")] == by_name[("t_seconds_count", None)] == 3
+    assert by_name[("t_seconds_sum", None)] == 7.75
+
+
+def test_histogram_le_is_inclusive_at_bucket_bounds():
+    _, samples = _histogram([0.1, 0.5, 1.0])
+    buckets = {s[1]["le"]: s[2] for s in samples if s[0] == "t_seconds_bucket"}
+    assert buckets == {"0.1": 1, "0.5": 2, "1": 3, "+Inf": 3}
+
+
+def test_histogram_renders_help_and_type():
+    h, _ = _histogram([0.2])
+    lines = h.render()
+    assert lines[:2] == ["# HELP t_seconds test", "# TYPE t_seconds histogram"]
+
+
+def test_counter_render_and_label_escaping():
+    c = Counter("t_total", "test", ("method", "route"))
+    c.inc(("GET", 'a"b\\c\nd'))
+    c.inc(("GET", 'a"b\\c\nd'), 2)
+    lines = c.render()
+    assert lines[1] == "# TYPE t_total counter"
+    assert lines[2] == 't_total{method="GET",route="a\\"b\\\\c\\nd"} 3'
+    assert "\n" not in lines[2]
+
+
+def test_render_ends_with_newline():
+    assert render().endswith("\n")
@@ -0,0 +1,89 @@
+"""Per-request Mongo query budget and N+1 detection in services.metrics."""
+
+import asyncio
+from types import SimpleNamespace
+
+from services import metrics
+from services.metrics import RequestStats, budget_violations, command_shape
+
+
+def test_command_shape_ignores_values():
+    one = command_shape("find", "teams", {"find": "teams", "filter": {"id": {"$in": ["a"]}}})
+    many = command_shape("find", "teams", {"find": "teams", "filter": {"id": {"$in": ["b", "c", "d"]}}})
+    assert one == many == "find teams {id:{$in:[?]}}"
+
+
+def test_command_shape_separates_structure_and_collection():
+    by_id = command_shape("find", "teams", {"filter": {"id": "x"}})
+    by_name = command_shape("find", "teams", {"filter": {"name": "x"}})
+    riders = command_shape("find", "riders", {"filter": {"id": "x"}})
+    assert len({by_id, by_name, riders}) == 3
+    assert command_shape("update", "matches", {"updates": [{"q": {"id": "m"}, "u": {}}]}) == "update matches [{id:?}]"
+
+
+def _stats(commands, shapes=None):
+    stats = RequestStats(track_shapes=True)
+    stats.commands = commands
+    stats.shapes.update(shapes or {})
+    return stats
+
+
+def test_budget_violations_flags_total_budget():
+    assert budget_violations(_stats(3), budget=5, repeat_limit=5) == []
+    assert budget_violations(_stats(6), budget=5, repeat_limit=5) == ["6 Mongo commands (budget 5)"]
+
+
+def test_budget_violations_flags_repeated_shapes():
+    stats = _stats(8, {"find teams {id:?}": 7, "find matches {id:?}": 1})
+    assert budget_violations(stats, budget=20, repeat_limit=5) == ["7x find teams {id:?}"]
+
+
+def _event(i, command):
+    name = next(iter(command))
+    return SimpleNamespace(request_id=i, operation_id=i, command_name=name, command=command, duration_micros=500)
+
+
+def _run(app, monkeypatch, mode):
+    monkeypatch.setattr(metrics, "QUERY_BUDGET_MODE", mode)
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/api/stub"}
+    asyncio.run(metrics.MetricsMiddleware(app)(scope, None, send))
+    return sent
+
+
+def _n_plus_one_app(n):
+    async def app(scope, receive, send):
+        scope["route"] = SimpleNamespace(path="/api/stub", endpoint=None)
+        for i in range(n):
+            event = _event(i, {"find": "teams", "filter": {"id": str(i)}})
+            metrics.command_listener.started(event)
+            metrics.command_listener.succeeded(event)
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b"ok"})
+    return app
+
+
+def test_strict_mode_replaces_response_with_500(monkeypatch):
+    sent = _run(_n_plus_one_app(metrics.QUERY_REPEAT_LIMIT + 1), monkeypatch, "strict")
+    start, body = sent
+    assert start["status"] == 500
+    headers = dict(start["headers"])
+    assert headers[b"x-mongo-queries"] == str(metrics.QUERY_REPEAT_LIMIT + 1).encode()
+    assert b"find teams {id:?}" in body["body"]
+
+
+def test_within_budget_passes_through_with_header(monkeypatch):
+    sent = _run(_n_plus_one_app(2), monkeypatch, "strict")
+    assert sent[0]["status"] == 200
+    assert dict(sent[0]["headers"])[b"x-mongo-queries"] == b"2"
+    assert sent[1]["body"] == b"ok"
+
+
+def test_off_mode_adds_no_header(monkeypatch):
+    sent = _run(_n_plus_one_app(10), monkeypatch, "off")
+    assert sent[0]["status"] == 200
+    assert b"x-mongo-queries" not in dict(sent[0]["headers"])
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from scraping.pipeline import run_pipeline
+
+
+def _run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=2))
+
+
+def test_all_items_processed_and_workers_stop():
+    seen = []
+
+    async def produce(todo):
+        for i in range(20):
+            await todo.put(i)
+
+    async def work(todo):
+        while (item := await todo.get()) is not None:
+            seen.append(item)
+
+    _run(run_pipeline(produce, work, concurrency=3, maxsize=6))
+    assert sorted(seen) == list(range(20))
+
+
+def test_cancel_mid_scrape_with_full_queue_returns():
+    async def main():
+        stuck = asyncio.Event()
+
+        async def produce(todo):
+            i = 0
+            while True:  # listningen tar aldrig slut av sig själv
+                await todo.put(i)
+                i += 1
+
+        async def work(todo):
+            await todo.get()
+            stuck.set()
+            await asyncio.Event().wait()  # hänger på en detaljsida
+
+        runner = asyncio.create_task(run_pipeline(produce, work, concurrency=2, maxsize=4))
+        await stuck.wait()
+        await asyncio.sleep(0)  # låt producenten fylla kön
+        runner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await runner
+
+    _run(main())
+
+
+def test_worker_crash_surfaces_instead_of_deadlocking():
+    async def produce(todo):
+        for i in range(100):
+            await todo.put(i)
+
+    async def work(todo):
+        await todo.get()
+        raise RuntimeError("worker died")
+
+    with pytest.raises(RuntimeError, match="worker died"):
+        _run(run_pipeline(produce, work, concurrency=2, maxsize=4))